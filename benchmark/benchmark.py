@@ -1,93 +1,194 @@
 from datetime import datetime
+from importlib import import_module
 import json
+import os
+import platform
+import resource
 import sys
+import time
+from typing import Dict, List, Optional
+
+import plac
+
+from corpus import corpus_info, synthetic_corpus
+from scenarios import SCENARIOS, Case, Context, max_rss_mb
 
 
 REPEAT = 5
-BATCH_SIZE = 128
-
-assert len(sys.argv) >= 2, "Usage: python {sys.argv[0]} [-g] model_name1 [model_name2 [...]]"
-if sys.argv[1] == "-g":
-    require_gpu = True
-    device = "GPU"
-    model_names = sys.argv[2:]
-else:
-    require_gpu = False
-    device = "CPU"
-    model_names = sys.argv[1:]
-
-sents = [_.rstrip("\n") for _ in sys.stdin]
-
-results = {}
-
-
-print("timestamp                 ", "[msec]", "device", 'procedure description', sep="\t", file=sys.stderr)
-start = datetime.now()
-prev = start
-print(start, 0, f"benchmark started with {len(sents)} sentences", sep="\t", file=sys.stderr)
-
-import spacy
-if require_gpu:
-    spacy.require_gpu()
-lap = datetime.now()
-dur = int((lap - prev).total_seconds() * 1000)
-print(lap, dur, device, 'import spacy', sep="\t", file=sys.stderr)
-prev = lap
-
-for model_name in model_names:
-    results = {}
-    nlp = spacy.load(model_name)
-    lap = datetime.now()
-    dur = int((lap - prev).total_seconds() * 1000)
-    results[f"spacy.load()"] = [dur]
-    print(lap, dur, device, f"spacy.load({model_name})", sep="\t", file=sys.stderr)
-    prev = lap
-
-    results[f"nlp.pipe(batch={BATCH_SIZE})"] = []
-    for repeat in range(1, REPEAT + 1):
-        for _ in range((len(sents) - 1) // BATCH_SIZE + 1):
-            docs = nlp.pipe(sents[_ * BATCH_SIZE:(_ + 1) * BATCH_SIZE])
-            for doc in docs:
-                len(doc)
-        lap = datetime.now()
-        dur = int((lap - prev).total_seconds() * 1000)
-        results[f"nlp.pipe(batch={BATCH_SIZE})"].append(dur / len(sents))
-        print(
-            lap,
-            dur,
-            device,
-            f"#{repeat} {model_name}->nlp.pipe(batch={BATCH_SIZE}): {dur / len(sents):.03f}[msec/sent]",
-            sep="\t", file=sys.stderr,
-        )
-        prev = lap
-
-    results[f"nlp(batch=1)"] = []
-    for repeat in range(1, REPEAT + 1):
-        for sent in sents:
-            doc = nlp(sent)
-            len(doc)
-        lap = datetime.now()
-        dur = int((lap - prev).total_seconds() * 1000)
-        results[f"nlp(batch=1)"].append(dur / len(sents))
+PROCESSES = "1,2,4"
+SYNTHETIC_LINES = 1000
+REGRESSION_THRESHOLD = 1.1
+
+
+def _versions() -> Dict[str, Optional[str]]:
+    from importlib.metadata import PackageNotFoundError, version
+    versions = {}
+    for package in ["ginza", "spacy", "sudachipy", "sudachidict_core", "ja_ginza", "ja_ginza_electra"]:
+        try:
+            versions[package] = version(package)
+        except PackageNotFoundError:
+            versions[package] = None
+    return versions
+
+
+def _environment(device: str) -> Dict:
+    return {
+        "device": device,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "versions": _versions(),
+    }
+
+
+def _median(values: List[float]) -> float:
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def run_case(case: Case, repeat: int, device: str) -> Dict:
+    walls = []
+    cpus = []
+    metrics = None
+    for n in range(1, (case.repeat or repeat) + 1):
+        prepared = case.prepare() if case.prepare else None
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        ret = case.work(prepared)
+        wall = (time.perf_counter() - wall) * 1000
+        cpu = (time.process_time() - cpu) * 1000
+        walls.append(wall)
+        cpus.append(cpu)
+        if isinstance(ret, dict):
+            metrics = ret
         print(
-            lap,
-            dur,
+            datetime.now(),
+            int(wall),
             device,
-            f"#{repeat} {model_name}->nlp(batch=1):   {dur / len(sents):.03f}[msec/sent]",
+            f"#{n} {case.name}: {wall / case.units:.03f}[msec/{case.unit}]",
             sep="\t", file=sys.stderr,
         )
-        prev = lap
+    if case.teardown:
+        case.teardown()
+    result = {
+        "wall_msec": _median(walls),
+        "cpu_msec": _median(cpus),
+        "wall_msec_all": walls,
+        "units": case.units,
+        "unit": case.unit,
+        "msec_per_unit": _median(walls) / case.units,
+        "units_per_sec": case.units * 1000 / _median(walls) if _median(walls) > 0 else 0.0,
+        "max_rss_mb": max_rss_mb(),
+        "children_max_rss_mb": max_rss_mb(resource.RUSAGE_CHILDREN),
+    }
+    if metrics:
+        result.update(metrics)
+    return result
+
+
+def compare(results: Dict, baseline_path: str) -> None:
+    """Prints the ratio of the median wall time of each case to the baseline of the same model and device."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baselines = [json.loads(line) for line in f if line.strip()]
+    for baseline in baselines:
+        if baseline["model"] == results["model"] and baseline["device"] == results["device"]:
+            break
+    else:
+        print(f"no baseline for {results['model']} on {results['device']} in {baseline_path}", file=sys.stderr)
+        return
+    print(f"{'case':<56}{'baseline':>12}{'current':>12}{'ratio':>8}", file=sys.stderr)
+    for name, result in results["results"].items():
+        base = baseline["results"].get(name)
+        if not base or not isinstance(base, dict) or not base.get("wall_msec"):
+            continue
+        ratio = result["wall_msec"] / base["wall_msec"]
+        mark = " *" if ratio > REGRESSION_THRESHOLD else ""
+        print(f"{name:<56}{base['wall_msec']:>12.1f}{result['wall_msec']:>12.1f}{ratio:>8.2f}{mark}", file=sys.stderr)
+
+
+def _load_corpus(input_path: Optional[str], synthetic: int):
+    if input_path == "-" or input_path is None and not sys.stdin.isatty():
+        lines = [_.rstrip("\n") for _ in sys.stdin]
+        if lines:
+            return lines, "stdin"
+    elif input_path:
+        with open(input_path, "r", encoding="utf-8") as f:
+            return [_.rstrip("\n") for _ in f], input_path
+    return synthetic_corpus(synthetic), f"synthetic({synthetic})"
+
+
+@plac.annotations(
+    require_gpu=("use GPU", "flag", "g"),
+    scenarios=("comma separated scenario names (default=all)", "option", "s", str),
+    input_path=("corpus file, - for stdin (default=stdin if piped, otherwise the synthetic corpus)", "option", "i", str),
+    synthetic=("number of lines of the synthetic corpus", "option", "n", int),
+    repeat=("repeat count of each case", "option", "r", int),
+    processes=("comma separated process counts of the parallel scenario", "option", "p", str),
+    output_path=("append the results to the file in JSON lines", "option", "o", str),
+    baseline=("compare the results with the JSON lines file of a previous run", "option", "b", str),
+    plugins=("comma separated modules which register additional scenarios", "option", "P", str),
+    list_scenarios=("list the scenarios and exit", "flag", "l"),
+    model_names=("model names", "positional"),
+)
+def main(
+    require_gpu=False,
+    scenarios=None,
+    input_path=None,
+    synthetic=SYNTHETIC_LINES,
+    repeat=REPEAT,
+    processes=PROCESSES,
+    output_path=None,
+    baseline=None,
+    plugins=None,
+    list_scenarios=False,
+    *model_names,
+):
+    for plugin in plugins.split(",") if plugins else []:
+        import_module(plugin)
+    if list_scenarios:
+        for name in SCENARIOS:
+            print(name)
+        return
+    assert model_names, f"Usage: python {sys.argv[0]} [-g] [-s scenario1,scenario2] model_name1 [model_name2 [...]]"
+    scenario_names = scenarios.split(",") if scenarios else list(SCENARIOS)
+    for name in scenario_names:
+        assert name in SCENARIOS, f"unknown scenario: {name}, choose from {list(SCENARIOS)}"
+
+    device = "GPU" if require_gpu else "CPU"
+    lines, source = _load_corpus(input_path, synthetic)
+
+    print("timestamp                 ", "[msec]", "device", "procedure description", sep="\t", file=sys.stderr)
+    print(datetime.now(), 0, device, f"benchmark started with {len(lines)} lines", sep="\t", file=sys.stderr)
+    if require_gpu:
+        import spacy
+        spacy.require_gpu()
 
-    dur = int((lap - start).total_seconds() * 1000)
-    print(lap, dur, device, model_name, 'finished', sep="\t", file=sys.stderr)
+    for model_name in model_names:
+        ctx = Context(model_name, require_gpu, lines, [int(_) for _ in processes.split(",")])
+        results = {}
+        try:
+            for name in scenario_names:
+                for case in SCENARIOS[name](ctx):
+                    results[case.name] = run_case(case, repeat, device)
+                    results[case.name]["scenario"] = name
+        finally:
+            ctx.close()
+        record = {
+            "model": model_name,
+            "device": device,
+            "timestamp": datetime.now().isoformat(),
+            "environment": _environment(device),
+            "corpus": corpus_info(lines, source),
+            "results": results,
+        }
+        json.dump(record, sys.stdout, ensure_ascii=False)
+        print()
+        if output_path:
+            with open(output_path, "a", encoding="utf-8") as f:
+                print(json.dumps(record, ensure_ascii=False), file=f)
+        if baseline:
+            compare(record, baseline)
 
-    for k, v in results.items():
-        l = sorted(v)
-        results[k] = l[len(l) // 2]
 
-    json.dump(
-        {"model": model_name, "device": device, "results": results},
-        sys.stdout,
-        ensure_ascii=False,
-    )
-    print()
+if __name__ == "__main__":
+    plac.call(main)
@@ -0,0 +1,77 @@
+import hashlib
+import random
+from typing import List
+
+
+SUBJECTS = [
+    "私", "彼", "彼女", "田中さん", "山田先生", "弟", "その会社", "東京都選挙管理委員会の担当者", "新しいチーム", "地元の住民",
+]
+
+OBJECTS = [
+    "かつ丼", "蕎麦", "本", "手紙", "新製品", "報告書", "写真", "データ", "機能性食品", "ランチ",
+]
+
+PLACES = [
+    "銀座", "東京タワーの近く", "京都", "大阪駅", "家", "会議室", "公園", "図書館", "北海道", "駅前の喫茶店",
+]
+
+TIMES = [
+    "今日", "明日", "昨日", "2023年4月1日", "午後3時", "先週", "来年", "毎朝", "10分後", "去年の夏",
+]
+
+VERBS = [
+    ("食べ", "た"), ("読ん", "だ"), ("書い", "た"), ("作っ", "た"), ("見", "た"), ("説明し", "た"), ("届け", "た"),
+    ("撮っ", "た"), ("調べ", "た"), ("注文し", "た"),
+]
+
+QUOTES = [
+    "「ありがとう」", "\"quote\"", "『重要』", "（注）", "#タグ", "\\記号",
+]
+
+TEMPLATES = [
+    "{time}は{place}で{object}を{verb}{past}。",
+    "{subject}は{time}{place}で{object}を{verb}{past}。",
+    "{subject}が{verb}{past}{object}は{place}にある。",
+    "{time}、{subject}は{place}へ行き、{object}を{verb}{past}。",
+    "{subject}は{quote}と言いながら{object}を{verb}{past}が、{place}では誰も気づかなかった。",
+    "{place}で{verb}{past}{object}について、{subject}は{time}までに報告書をまとめる予定だ。",
+    "{subject}によると、{time}に{place}で{object}が{verb}られ{past}という。",
+    "{object}",
+    "{subject}、{place}、{time}。",
+]
+
+
+def synthetic_corpus(n_lines: int = 1000, seed: int = 0, max_sentences: int = 4) -> List[str]:
+    """Generates n_lines of Japanese text from the templates.
+
+    Each line has 1 to max_sentences sentences, so the lengths vary like the real input.
+    The result only depends on the arguments, so the corpus can be regenerated offline on any machine.
+    """
+    rand = random.Random(seed)
+    lines = []
+    for _ in range(n_lines):
+        sentences = []
+        for _ in range(rand.randint(1, max_sentences)):
+            verb, past = rand.choice(VERBS)
+            sentences.append(
+                rand.choice(TEMPLATES).format(
+                    subject=rand.choice(SUBJECTS),
+                    object=rand.choice(OBJECTS),
+                    place=rand.choice(PLACES),
+                    time=rand.choice(TIMES),
+                    verb=verb,
+                    past=past,
+                    quote=rand.choice(QUOTES),
+                )
+            )
+        lines.append("".join(sentences))
+    return lines
+
+
+def corpus_info(lines: List[str], source: str) -> dict:
+    return {
+        "source": source,
+        "lines": len(lines),
+        "chars": sum(len(line) for line in lines),
+        "sha1": hashlib.sha1("\n".join(lines).encode("utf-8")).hexdigest(),
+    }
@@ -1,3 +1,3 @@
 #!/bin/bash
-cat gsd/dev.txt gsd/test.txt | python benchmark.py -g ja_ginza ja_ginza_electra
-cat gsd/dev.txt gsd/test.txt | python benchmark.py ja_ginza ja_ginza_electra
+cat gsd/dev.txt gsd/test.txt | python benchmark.py -i - -o results.jsonl -g ja_ginza ja_ginza_electra
+cat gsd/dev.txt gsd/test.txt | python benchmark.py -i - -o results.jsonl ja_ginza ja_ginza_electra
@@ -1,3 +1,4 @@
 #!/bin/bash
-cat gsd/dev.txt gsd/test.txt | python benchmark.py -g ja_core_news_md ja_core_news_trf
-cat gsd/dev.txt gsd/test.txt | python benchmark.py ja_core_news_md ja_core_news_trf
+# the other scenarios depend on the bunsetu and clause annotations of GiNZA
+cat gsd/dev.txt gsd/test.txt | python benchmark.py -i - -o results.jsonl -s load,pipeline,peak_rss -g ja_core_news_md ja_core_news_trf
+cat gsd/dev.txt gsd/test.txt | python benchmark.py -i - -o results.jsonl -s load,pipeline,peak_rss ja_core_news_md ja_core_news_trf
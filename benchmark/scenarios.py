@@ -0,0 +1,303 @@
+import os
+import resource
+import sys
+import tempfile
+from multiprocessing import get_context
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+
+SCENARIOS = {}
+
+BATCH_SIZE = 128
+
+
+class Case:
+    """A measured unit of a scenario.
+
+    `work(prepared)` is timed `repeat` times (the default repeat of the suite if None).
+    `prepare()` is called before each repetition out of the timing, and `teardown()` once after all repetitions.
+    `units` is the number of the processed items in a repetition, used for the throughput.
+    If `work` returns a dict, it is reported as the metrics of the case instead of being timed.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        work: Callable[[Any], Any],
+        units: int,
+        unit: str = "line",
+        repeat: Optional[int] = None,
+        prepare: Optional[Callable[[], Any]] = None,
+        teardown: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self.name = name
+        self.work = work
+        self.units = units
+        self.unit = unit
+        self.repeat = repeat
+        self.prepare = prepare
+        self.teardown = teardown
+
+
+class Context:
+    """The settings and the shared objects of the scenarios of a model."""
+
+    def __init__(self, model_name: str, require_gpu: bool, lines: List[str], processes: List[int]) -> None:
+        self.model_name = model_name
+        self.require_gpu = require_gpu
+        self.lines = lines
+        self.processes = processes
+        self._nlp = None
+        self._docs = None
+        self._corpus_path = None
+
+    @property
+    def nlp(self):
+        if self._nlp is None:
+            import spacy
+            self._nlp = spacy.load(self.model_name)
+        return self._nlp
+
+    @property
+    def docs(self):
+        if self._docs is None:
+            self._docs = list(self.nlp.pipe(self.lines, batch_size=BATCH_SIZE))
+        return self._docs
+
+    @property
+    def corpus_path(self) -> str:
+        if self._corpus_path is None:
+            fd, self._corpus_path = tempfile.mkstemp(prefix="ginza-benchmark-", suffix=".txt")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                for line in self.lines:
+                    print(line, file=f)
+        return self._corpus_path
+
+    def close(self) -> None:
+        if self._corpus_path:
+            os.unlink(self._corpus_path)
+            self._corpus_path = None
+
+
+def scenario(name: str):
+    """Registers a scenario function, which takes a Context and yields the Cases to measure."""
+    def register(func: Callable[[Context], Iterator[Case]]):
+        SCENARIOS[name] = func
+        return func
+    return register
+
+
+def max_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    if who == resource.RUSAGE_SELF:
+        # VmHWM is the peak of the current process image, while ru_maxrss may be taken over from the parent
+        try:
+            with open("/proc/self/status", "r") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+    max_rss = resource.getrusage(who).ru_maxrss
+    return max_rss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+@scenario("load")
+def load(ctx: Context) -> Iterator[Case]:
+    import spacy
+    yield Case("spacy.load()", lambda _: spacy.load(ctx.model_name), 1, unit="model", repeat=1)
+
+
+@scenario("tokenizer")
+def tokenizer(ctx: Context) -> Iterator[Case]:
+    from ginza.analyzer import try_sudachi_import
+
+    sudachi = try_sudachi_import("A")
+    nlp = ctx.nlp
+
+    def sudachi_tokenize(_):
+        for line in ctx.lines:
+            sudachi.tokenize(line)
+
+    yield Case("sudachi.tokenize()", sudachi_tokenize, len(ctx.lines))
+
+    def make_doc(_):
+        for line in ctx.lines:
+            nlp.make_doc(line)
+
+    yield Case("nlp.make_doc()", make_doc, len(ctx.lines))
+
+
+@scenario("pipeline")
+def pipeline(ctx: Context) -> Iterator[Case]:
+    nlp = ctx.nlp
+
+    def pipe(_):
+        for _ in nlp.pipe(ctx.lines, batch_size=BATCH_SIZE):
+            pass
+
+    yield Case(f"nlp.pipe(batch={BATCH_SIZE})", pipe, len(ctx.lines))
+
+    def single(_):
+        for line in ctx.lines:
+            nlp(line)
+
+    yield Case("nlp(batch=1)", single, len(ctx.lines))
+
+
+@scenario("components")
+def components(ctx: Context) -> Iterator[Case]:
+    nlp = ctx.nlp
+    for name in ["compound_splitter", "bunsetu_recognizer"]:
+        if name not in nlp.pipe_names:
+            continue
+        # the docs just before the component
+        following = nlp.pipe_names[nlp.pipe_names.index(name):]
+        with nlp.select_pipes(disable=following):
+            docs = list(nlp.pipe(ctx.lines, batch_size=BATCH_SIZE))
+        proc = nlp.get_pipe(name)
+
+        def apply(copies, proc=proc):
+            for doc in copies:
+                proc(doc)
+
+        yield Case(name, apply, len(docs), prepare=lambda docs=docs: [doc.copy() for doc in docs])
+
+
+@scenario("analyze_batch")
+def analyze_batch(ctx: Context) -> Iterator[Case]:
+    from ginza.analyzer import Analyzer
+    from ginza.command_line import MINI_BATCH_SIZE
+
+    batches = [ctx.lines[i:i + MINI_BATCH_SIZE] for i in range(0, len(ctx.lines), MINI_BATCH_SIZE)]
+    for output_format in ["conllu", "cabocha", "json", "jsonl", "docbin", "mecab"]:
+        analyzer = Analyzer(ctx.model_name, None, "analyze", output_format, -1, False, False)
+        if output_format == "mecab":
+            analyzer.set_nlp()
+        else:
+            # shares the loaded pipeline between the formats
+            analyzer.nlp = ctx.nlp
+            analyzer.use_orth_if_reading_is_none = True
+
+        def analyze(_, analyzer=analyzer):
+            for batch in batches:
+                analyzer.analyze_batch(batch)
+
+        yield Case(f"analyze_batch({output_format})", analyze, len(ctx.lines))
+
+
+@scenario("mecab_threads")
+def mecab_threads(ctx: Context) -> Iterator[Case]:
+    from ginza.analyzer import Analyzer
+    from ginza.command_line import MINI_BATCH_SIZE
+
+    batches = [ctx.lines[i:i + MINI_BATCH_SIZE] for i in range(0, len(ctx.lines), MINI_BATCH_SIZE)]
+    for threads in ctx.processes:
+        analyzer = Analyzer(None, None, "analyze", "mecab", -1, False, True, threads=threads)
+        analyzer.set_nlp()
+
+        def analyze(_, analyzer=analyzer):
+            for batch in batches:
+                analyzer.analyze_batch(batch)
+
+        yield Case(f"analyze_batch(mecab, threads={threads})", analyze, len(ctx.lines))
+
+
+@scenario("format")
+def formatters(ctx: Context) -> Iterator[Case]:
+    from ginza.analyzer import format_docs
+
+    docs = ctx.docs
+    for output_format in ["conllu", "cabocha", "json", "jsonl"]:
+        yield Case(
+            f"format_docs({output_format})",
+            lambda _, output_format=output_format: format_docs(docs, output_format, False, True),
+            len(docs),
+        )
+
+
+@scenario("parallel")
+def parallel(ctx: Context) -> Iterator[Case]:
+    if ctx.require_gpu:
+        print("parallel scenario skipped on GPU", file=sys.stderr)
+        return
+    from ginza import AnalyzerPool
+    from ginza.analyzer import Analyzer
+    from ginza.command_line import MiniBatchSizer, _OutputWrapper, _analyze_parallel
+
+    for processes in ctx.processes:
+        analyzer = Analyzer(ctx.model_name, None, "analyze", "conllu", -1, False, False)
+        pool = AnalyzerPool(analyzer, processes)
+        pool.start()
+        # waits until all the processes load the model
+        for _ in pool.analyze_batches([[line] for line in ctx.lines[:processes * 4]]):
+            pass
+
+        def analyze(_, pool=pool):
+            output = _OutputWrapper(os.devnull, "conllu")
+            output.open()
+            try:
+                _analyze_parallel(pool, output, [ctx.corpus_path], MiniBatchSizer())
+            finally:
+                output.close()
+
+        yield Case(f"_analyze_parallel(processes={processes})", analyze, len(ctx.lines), teardown=pool.close)
+
+
+@scenario("helpers")
+def helpers(ctx: Context) -> Iterator[Case]:
+    from ginza import bunsetu_head_tokens, bunsetu_spans, bunsetu_phrase_spans, clauses, clause_head_i, is_bunsetu_head, sub_phrases, phrases
+
+    docs = ctx.docs
+    n_sents = sum(1 for doc in docs for _ in doc.sents)
+
+    def bunsetu_helpers(_):
+        for doc in docs:
+            for sent in doc.sents:
+                for span in bunsetu_spans(sent):
+                    for token in span:
+                        is_bunsetu_head(token)
+                bunsetu_phrase_spans(sent)
+
+    yield Case("bunsetu_spans/bunsetu_phrase_spans/is_bunsetu_head", bunsetu_helpers, n_sents, unit="sentence")
+
+    def phrase_helpers(_):
+        for doc in docs:
+            for sent in doc.sents:
+                phrases(sent)
+                for token in bunsetu_head_tokens(sent):
+                    sub_phrases(token)
+
+    yield Case("phrases/sub_phrases", phrase_helpers, n_sents, unit="sentence")
+
+    def clause_helpers(_):
+        for doc in docs:
+            clauses(doc)
+            for sent in doc.sents:
+                for token in sent:
+                    clause_head_i(token, sent.start)
+
+    yield Case("clauses/clause_head_i", clause_helpers, len(docs))
+
+
+def _peak_rss_child(model_name: str, lines: List[str], queue) -> None:
+    import spacy
+    nlp = spacy.load(model_name)
+    loaded = max_rss_mb()
+    for _ in nlp.pipe(lines, batch_size=BATCH_SIZE):
+        pass
+    queue.put({"max_rss_mb_after_load": loaded, "max_rss_mb_after_pipe": max_rss_mb()})
+
+
+@scenario("peak_rss")
+def peak_rss(ctx: Context) -> Iterator[Case]:
+    def measure(_) -> Dict[str, float]:
+        # measured in a fresh process so that the other scenarios do not affect the peak
+        context = get_context("spawn")
+        queue = context.Queue()
+        p = context.Process(target=_peak_rss_child, args=(ctx.model_name, ctx.lines, queue))
+        p.start()
+        result = queue.get()
+        p.join()
+        return result
+
+    yield Case("peak_rss(spacy.load+nlp.pipe)", measure, len(ctx.lines), repeat=1)
@@ -42,10 +42,13 @@ __all__ = [
     "clauses",
     "clause_head",
     "clause_head_i",
+    "clause_head_list",
     "BunsetuRecognizer",
     # from compound_splitter
     "CompoundSplitter",
     "tag_to_pos",
+    # from analyzer_pool
+    "AnalyzerPool",
 ]
 
 
@@ -253,7 +256,11 @@ def bunsetu_position_type(token: Token):
 
 
 def is_bunsetu_head(token: Token):
-    return token.i in token.doc.user_data["bunsetu_heads"]
+    doc = token.doc
+    head_flags = doc.user_data.get("bunsetu_head_flags")
+    if head_flags is not None and len(head_flags) == len(doc):
+        return head_flags[token.i]
+    return token.i in doc.user_data["bunsetu_heads"]
 
 
 SEP = "+"
@@ -387,7 +394,7 @@ def _sub_phrases(
         (
             t.dep_,
             phrase_func(t),
-        ) for t in bunsetu_span(token).root.children if t.i in bunsetu_head_list(token.doc) and condition_func(t)
+        ) for t in bunsetu_span(token).root.children if is_bunsetu_head(t) and condition_func(t)
     ]
 
 
@@ -466,3 +473,7 @@ def _sub_tokens(
     return join_func([
         sub_token_func(element) for element in elements
     ])
+
+
+# analyzer_pool imports the getters above via analyzer, so it must be imported last
+from .analyzer_pool import AnalyzerPool
@@ -1,33 +1,42 @@
 # coding: utf8
+from concurrent.futures import ThreadPoolExecutor
+import json
 import sys
-from typing import Iterable, Optional
+import threading
+from typing import Dict, Iterable, List, Optional, Union
 
+import numpy
 import thinc
 
 import spacy
-from spacy.tokens import Doc, Span
+from spacy.attrs import DEP, ENT_IOB, ENT_TYPE, HEAD, LEMMA, MORPH, NORM, ORTH, POS, SPACY, TAG
+from spacy.tokens import Doc, DocBin, Span, Token
 from spacy.language import Language
 from spacy.lang.ja import Japanese
 
 from . import set_split_mode, inflection, reading_form, ent_label_ene, ent_label_ontonotes, bunsetu_bi_label, bunsetu_position_type, clause_head_i
 from .bunsetu_recognizer import bunsetu_available, bunsetu_head_list, bunsetu_phrase_span
+from .compound_splitter import CompoundSplitter
+from .ene_ontonotes_mapper import ENE_ONTONOTES_MAPPING
+from .profiler import Profiler
 
+OUTPUT_FORMAT_NAMES = {
+    "0": "conllu",
+    "1": "cabocha",
+    "2": "mecab",
+    "3": "json",
+    "4": "jsonl",
+    "5": "docbin",
+}
 
-def try_sudachi_import(split_mode: str):
+
+def try_sudachi_dictionary():
     """SudachiPy is required for Japanese support, so check for it.
-    It it's not available blow up and explain how to fix it.
-    split_mode should be one of these values: "A", "B", "C", None->"A"."""
+    It it's not available blow up and explain how to fix it."""
     try:
-        from sudachipy import dictionary, tokenizer
-
-        split_mode = {
-            None: tokenizer.Tokenizer.SplitMode.A,
-            "A": tokenizer.Tokenizer.SplitMode.A,
-            "B": tokenizer.Tokenizer.SplitMode.B,
-            "C": tokenizer.Tokenizer.SplitMode.C,
-        }[split_mode]
-        tok = dictionary.Dictionary().create(mode=split_mode)
-        return tok
+        from sudachipy import dictionary
+
+        return dictionary.Dictionary()
     except ImportError:
         raise ImportError(
             "Japanese support requires SudachiPy and SudachiDict-core "
@@ -37,6 +46,23 @@ def try_sudachi_import(split_mode: str):
         ) from None
 
 
+def try_sudachi_import(split_mode: str, sudachi_dictionary=None):
+    """Creates a SudachiPy tokenizer, from sudachi_dictionary if given to share the loaded dictionary.
+    split_mode should be one of these values: "A", "B", "C", None->"A"."""
+    if sudachi_dictionary is None:
+        sudachi_dictionary = try_sudachi_dictionary()
+    from sudachipy import tokenizer
+
+    split_mode = {
+        None: tokenizer.Tokenizer.SplitMode.A,
+        "A": tokenizer.Tokenizer.SplitMode.A,
+        "B": tokenizer.Tokenizer.SplitMode.B,
+        "C": tokenizer.Tokenizer.SplitMode.C,
+    }[split_mode]
+    tok = sudachi_dictionary.create(mode=split_mode)
+    return tok
+
+
 class Analyzer:
     def __init__(
         self,
@@ -47,6 +73,8 @@ class Analyzer:
         require_gpu: int,
         disable_sentencizer: bool,
         use_normalized_form: bool,
+        profile: bool = False,
+        threads: int = 1,
     ) -> None:
         self.model_name_or_path = model_name_or_path
         self.split_mode = split_mode
@@ -55,7 +83,14 @@ class Analyzer:
         self.require_gpu = require_gpu
         self.disable_sentencizer = disable_sentencizer
         self.use_normalized_form = use_normalized_form
+        self.profiler = Profiler() if profile else None
+        self.threads = threads
         self.nlp: Optional[Language] = None
+        # for the mecab output: the part of speech strings by the id, and the tokenizer threads created on demand
+        self.sudachi_dictionary = None
+        self.pos_cache: Dict[int, str] = {}
+        self._executor = None
+        self._thread_local = None
 
     def set_nlp(self) -> None:
         if self.nlp:
@@ -65,7 +100,8 @@ class Analyzer:
             thinc.api.require_gpu(self.require_gpu)
 
         if self.output_format in ["2", "mecab"]:
-            nlp = try_sudachi_import(self.split_mode)
+            self.sudachi_dictionary = try_sudachi_dictionary()
+            nlp = try_sudachi_import(self.split_mode, self.sudachi_dictionary)
         else:
             # Work-around for pickle error. Need to share model data.
             if self.model_name_or_path:
@@ -91,13 +127,18 @@ class Analyzer:
         self.nlp = nlp
         self.use_orth_if_reading_is_none = isinstance(self.nlp, Japanese)
 
-    def analyze_batch(self, lines: Iterable[str]) -> str:
+    def analyze_batch(self, lines: Iterable[str]) -> Union[str, bytes]:
         self.set_nlp()
+        if self.profiler:
+            lines = list(lines)
+            self.profiler.count(lines=len(lines))
         if self.output_format in ["2", "mecab"]:
-            return "".join(self.analyze_line(line) for line in lines)
+            if self.profiler:
+                return "".join(self.analyze_line(line) for line in lines)
+            return self._analyze_mecab_batch(lines)
 
         if self.hash_comment == "print":
-            batch = list(self.nlp.pipe(line.rstrip("\n") for line in lines if not line.startswith("#")))
+            batch = list(self._pipe(line.rstrip("\n") for line in lines if not line.startswith("#")))
             docs = []
             index = 0
             for line in lines:
@@ -108,13 +149,12 @@ class Analyzer:
                     index += 1
         else:
             lines = [line.rstrip("\n") for line in lines if self.hash_comment != "skip" or not line.startswith("#")]
-            docs = self.nlp.pipe(lines)
+            docs = self._pipe(lines)
 
-        if self.output_format in ["3", "json"]:
-            sep = ",\n"
-        else:
-            sep = ""
-        return sep.join(format_doc(doc, self.output_format, self.use_normalized_form, self.use_orth_if_reading_is_none) if isinstance(doc, Doc) else doc for doc in docs)
+        if self.profiler:
+            with self.profiler.measure(self._formatter_name(), "formatters"):
+                return self._format_docs(docs)
+        return self._format_docs(docs)
 
     def analyze_line(self, input_line: str) -> str:
         line = input_line.rstrip("\n")
@@ -123,60 +163,132 @@ class Analyzer:
                 return input_line
             elif self.hash_comment == "skip":
                 return ""
-        if line == "":
+        if line == "" and self.output_format not in ["4", "jsonl"]:
             return "\n"
+        if self.profiler is None:
+            if self.output_format in ["2", "mecab"]:
+                return format_mecab(self.nlp.tokenize(line), self.use_normalized_form, self.pos_cache)
+            else:
+                doc = self.nlp(line)
+            return format_doc(doc, self.output_format, self.use_normalized_form, self.use_orth_if_reading_is_none)
+
         if self.output_format in ["2", "mecab"]:
-            doc = self.nlp.tokenize(line)
+            with self.profiler.measure("tokenizer"):
+                doc = self.nlp.tokenize(line)
+            self.profiler.count(docs=1, sentences=1, tokens=len(doc))
+            with self.profiler.measure(self._formatter_name(), "formatters"):
+                return format_mecab(doc, self.use_normalized_form, self.pos_cache)
         else:
-            doc = self.nlp(line)
-        return format_doc(doc, self.output_format, self.use_normalized_form, self.use_orth_if_reading_is_none)
+            doc = self._pipe([line])[0]
+        with self.profiler.measure(self._formatter_name(), "formatters"):
+            return format_doc(doc, self.output_format, self.use_normalized_form, self.use_orth_if_reading_is_none)
+
+    def _analyze_mecab_batch(self, lines: Iterable[str]) -> str:
+        if self.threads <= 1:
+            return self._analyze_mecab_lines(lines, self.nlp)
+        lines = list(lines)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.threads, thread_name_prefix="ginza-sudachi")
+            self._thread_local = threading.local()
+        # the threads analyze the contiguous chunks of the lines in parallel as far as SudachiPy releases the GIL
+        size = -(-len(lines) // self.threads)
+        chunks = [lines[i:i + size] for i in range(0, len(lines), size)]
+        return "".join(self._executor.map(self._analyze_mecab_chunk, chunks))
+
+    def _analyze_mecab_chunk(self, lines: List[str]) -> str:
+        tokenizer = getattr(self._thread_local, "tokenizer", None)
+        if tokenizer is None:
+            # a tokenizer is not thread-safe, so each thread creates its own from the dictionary loaded once
+            tokenizer = self._thread_local.tokenizer = try_sudachi_import(self.split_mode, self.sudachi_dictionary)
+        return self._analyze_mecab_lines(lines, tokenizer)
+
+    def _analyze_mecab_lines(self, lines: Iterable[str], tokenizer) -> str:
+        results = []
+        morphemes = None
+        for input_line in lines:
+            line = input_line.rstrip("\n")
+            if line.startswith("#"):
+                if self.hash_comment == "print":
+                    results.append(input_line)
+                    continue
+                elif self.hash_comment == "skip":
+                    continue
+            if line == "":
+                results.append("\n")
+                continue
+            # reuses the morpheme list of the previous line, which is already formatted
+            morphemes = tokenizer.tokenize(line, out=morphemes)
+            results.append(format_mecab(morphemes, self.use_normalized_form, self.pos_cache))
+        return "".join(results)
+
+    def _pipe(self, texts: Iterable[str]) -> Iterable[Doc]:
+        if self.profiler is None:
+            return self.nlp.pipe(texts)
+
+        # runs the components one by one over the whole batch to measure each of them
+        with self.profiler.measure("tokenizer"):
+            docs = [self.nlp.make_doc(text) for text in texts]
+        for name, proc in self.nlp.pipeline:
+            if isinstance(proc, CompoundSplitter):
+                stats = proc.stats()
+            with self.profiler.measure(name):
+                if hasattr(proc, "pipe"):
+                    docs = list(proc.pipe(docs, batch_size=self.nlp.batch_size))
+                else:
+                    docs = [proc(doc) for doc in docs]
+            if isinstance(proc, CompoundSplitter):
+                self.profiler.count(**{k: v - stats[k] for k, v in proc.stats().items()})
+        self.profiler.count(
+            docs=len(docs),
+            sentences=sum(len(list(doc.sents)) for doc in docs if doc.has_annotation("SENT_START")),
+            tokens=sum(len(doc) for doc in docs),
+        )
+        return docs
+
+    def _format_docs(self, docs: Iterable[Union[Doc, str]]) -> Union[str, bytes]:
+        if self.output_format in ["5", "docbin"]:
+            return DocBin(store_user_data=True, docs=docs).to_bytes()
+        return format_docs(docs, self.output_format, self.use_normalized_form, self.use_orth_if_reading_is_none)
+
+    def _formatter_name(self) -> str:
+        return "format_" + OUTPUT_FORMAT_NAMES.get(self.output_format, self.output_format)
+
+
+def format_docs(
+   docs: Iterable[Union[Doc, str]], output_format: str, use_normalized_form: bool, use_orth_if_reading_is_none: bool,
+) -> str:
+    if output_format in ["3", "json"]:
+        sep = ",\n"
+    else:
+        sep = ""
+    return sep.join(format_doc(doc, output_format, use_normalized_form, use_orth_if_reading_is_none) if isinstance(doc, Doc) else doc for doc in docs)
 
 
 def format_doc(
    doc: Doc, output_format: str, use_normalized_form: bool, use_orth_if_reading_is_none: bool,
 ) -> str:
     if output_format in ["0", "conllu"]:
-        return "".join(format_conllu(sent, use_normalized_form, use_orth_if_reading_is_none) for sent in doc.sents)
+        return format_conllu_doc(doc, use_normalized_form, use_orth_if_reading_is_none)
     elif output_format in ["1", "cabocha"]:
-        return "".join(format_cabocha(sent, use_normalized_form) for sent in doc.sents)
+        return format_cabocha_doc(doc, use_normalized_form)
     elif output_format in ["2", "mecab"]:
         return "".join(format_mecab(doc, use_normalized_form))
     elif output_format in ["3", "json"]:
         return ",\n".join(format_json(sent) for sent in doc.sents)
+    elif output_format in ["4", "jsonl"]:
+        return format_jsonl(doc)
     else:
         raise Exception(output_format + " is not supported")
 
 
 def format_json(sent: Span) -> str:
     token_lines = ",\n".join(
-        f"""       {{"id":{
-            token.i - sent.start + 1
-        },"orth":"{
-            token.orth_
-        }","tag":"{
-            token.tag_
-        }","pos":"{
-            token.pos_
-        }","lemma":"{
-            token.lemma_
-        }","norm":"{
-            token.norm_
-        }","head":{
-            token.head.i - token.i
-        },"dep":"{
-            token.dep_
-        }","ner":"{
-            token.ent_iob_
-        }{
-            "-" + token.ent_type_ if token.ent_type_ else ""
-        }"{
-            ',"whitespacce":"' + token.whitespace_ + '"' if token.whitespace_ else ""
-        }}}""" for token in sent
+        "       " + json.dumps(json_token(sent, token), ensure_ascii=False, separators=(",", ":")) for token in sent
     )
     return f""" {{
   "paragraphs": [
    {{
-    "raw": "{sent.text}",
+    "raw": {json.dumps(sent.text, ensure_ascii=False)},
     "sentences": [
      {{
       "tokens": [
@@ -189,6 +301,39 @@ def format_json(sent: Span) -> str:
  }}"""
 
 
+def format_jsonl(doc: Doc) -> str:
+    data = {
+        "paragraphs": [
+            {
+                "raw": doc.text,
+                "sentences": [
+                    {
+                        "tokens": [json_token(sent, token) for token in sent],
+                    } for sent in doc.sents
+                ],
+            }
+        ]
+    }
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def json_token(sent: Span, token) -> dict:
+    data = {
+        "id": token.i - sent.start + 1,
+        "orth": token.orth_,
+        "tag": token.tag_,
+        "pos": token.pos_,
+        "lemma": token.lemma_,
+        "norm": token.norm_,
+        "head": token.head.i - token.i,
+        "dep": token.dep_,
+        "ner": token.ent_iob_ + ("-" + token.ent_type_ if token.ent_type_ else ""),
+    }
+    if token.whitespace_:
+        data["whitespacce"] = token.whitespace_
+    return data
+
+
 def format_conllu(sent: Span, use_normalized_form, use_orth_if_reading_is_none, print_origin=True) -> str:
     np_labels = [""] * len(sent)
     use_bunsetu = bunsetu_available(sent)
@@ -206,6 +351,90 @@ def format_conllu(sent: Span, use_normalized_form, use_orth_if_reading_is_none,
         return f"{token_lines}\n"
 
 
+def format_conllu_doc(doc: Doc, use_normalized_form, use_orth_if_reading_is_none, print_origin=True) -> str:
+    """Same as joining format_conllu() over doc.sents, but takes the columns of all the tokens at once."""
+    if not bunsetu_available(doc):
+        return "".join(format_conllu(sent, use_normalized_form, use_orth_if_reading_is_none, print_origin) for sent in doc.sents)
+
+    strings = doc.vocab.strings
+    array = doc.to_array([ORTH, NORM if use_normalized_form else LEMMA, POS, TAG, DEP, ENT_IOB, ENT_TYPE, SPACY, MORPH])
+    heads = (numpy.arange(len(doc), dtype="int64") + doc.to_array(HEAD).astype("int64")).tolist()
+    bunsetu_bi = doc.user_data["bunsetu_bi_labels"]
+    position_types = doc.user_data["bunsetu_position_types"]
+    clause_heads = doc.user_data["clause_heads"]
+    iob_strings = Token.iob_strings()
+
+    # the columns independent of the sentence: form to feats joined, deprel, and the misc fields before and after NP label
+    columns = []
+    misc_features = {}
+    for i, (orth, lemma, pos, tag, dep, ent_iob, ent_type, spacy, morph) in enumerate(array.tolist()):
+        pos = strings[pos]
+        dep = strings[dep]
+        misc_head = "SpaceAfter=Yes" if spacy else "SpaceAfter=No"
+        if bunsetu_bi[i]:
+            misc_head += f"|BunsetuBILabel={bunsetu_bi[i]}"
+        if position_types[i]:
+            misc_head += f"|BunsetuPositionType={position_types[i]}"
+        features = misc_features.get(morph)
+        if features is None:
+            features = misc_features[morph] = _morph_features(doc[i])
+        inf, reading = features
+        if reading is None and use_orth_if_reading_is_none:
+            reading = strings[orth]
+        misc_tail = ["" if not inf else f"Inf={inf}"]
+        if reading:
+            misc_tail.append("Reading={}".format(reading.replace("|", "\\|").replace("\\", "\\\\")))
+        iob = iob_strings[ent_iob]
+        if iob in "BI":
+            ent_type = strings[ent_type]
+            misc_tail.append("NE={}-{}".format(iob, ENE_ONTONOTES_MAPPING.get(ent_type, "OTHERS")))
+            misc_tail.append(f"ENE={iob}-{ent_type}")
+        columns.append((
+            "\t".join([
+                strings[orth],
+                strings[lemma],
+                pos,
+                strings[tag].replace(",*", "").replace(",", "-"),
+                "NumType=Card" if pos == "NUM" else "_",
+            ]),
+            dep.lower() if dep else "_",
+            misc_head,
+            "|".join(_ for _ in misc_tail if _),
+        ))
+
+    lines = []
+    for sent in doc.sents:
+        start = sent.start
+        np_labels = [""] * len(sent)
+        for head_i in bunsetu_head_list(sent):
+            phrase = bunsetu_phrase_span(sent[head_i])
+            if phrase.label_ == "NP":
+                for idx in range(phrase.start - start, phrase.end - start):
+                    np_labels[idx] = "NP_B" if idx == phrase.start else "NP_I"
+        if print_origin:
+            lines.append(f"# text = {sent.text}\n")
+        for i in range(start, sent.end):
+            token_columns, deprel, misc_head, misc_tail = columns[i]
+            misc = misc_head
+            np_label = np_labels[i - start]
+            if np_label:
+                misc += "|" + np_label
+            if misc_tail:
+                misc += "|" + misc_tail
+            clause_head = clause_heads[i] - start + 1
+            if clause_head:
+                misc += f"|ClauseHead={clause_head}"
+            head = heads[i]
+            lines.append(f"{i - start + 1}\t{token_columns}\t{0 if head == i else head - start + 1}\t{deprel}\t_\t{misc}\n")
+        lines.append("\n")
+    return "".join(lines)
+
+
+def _morph_features(token: Token) -> tuple:
+    # the inflection and the reading, which only depend on the morph of the token except for the reading fallback
+    return inflection(token), reading_form(token, False)
+
+
 def conllu_token_line(sent, token, np_label, use_bunsetu, use_normalized_form, use_orth_if_reading_is_none) -> str:
     bunsetu_bi = bunsetu_bi_label(token) if use_bunsetu else None
     position_type = bunsetu_position_type(token) if use_bunsetu else None
@@ -213,7 +442,7 @@ def conllu_token_line(sent, token, np_label, use_bunsetu, use_normalized_form, u
     reading = reading_form(token, use_orth_if_reading_is_none)
     ne = ent_label_ontonotes(token)
     ene = ent_label_ene(token)
-    clause_head = clause_head_i(token) + 1
+    clause_head = clause_head_i(token, sent.start) + 1
     misc = "|".join(
         filter(
             lambda s: s,
@@ -264,6 +493,75 @@ def format_cabocha(sent: Span, use_normalized_form) -> str:
     return "".join(lines)
 
 
+def format_cabocha_doc(doc: Doc, use_normalized_form) -> str:
+    """Same as joining format_cabocha() over doc.sents, but computes the bunsetu dependencies in a linear pass."""
+    if not bunsetu_available(doc):
+        return "".join(format_cabocha(sent, use_normalized_form) for sent in doc.sents)
+
+    strings = doc.vocab.strings
+    array = doc.to_array([ORTH, NORM if use_normalized_form else LEMMA, TAG, ENT_IOB, ENT_TYPE, MORPH])
+    heads = (numpy.arange(len(doc), dtype="int64") + doc.to_array(HEAD).astype("int64")).tolist()
+    bunsetu_bi = doc.user_data["bunsetu_bi_labels"]
+    position_types = doc.user_data["bunsetu_position_types"]
+    iob_strings = Token.iob_strings()
+
+    token_lines = []
+    morph_features = {}
+    for i, (orth, lemma, tag, ent_iob, ent_type, morph) in enumerate(array.tolist()):
+        orth = strings[orth]
+        features = morph_features.get(morph)
+        if features is None:
+            features = morph_features[morph] = _morph_features(doc[i])
+        inf, reading = features
+        part_of_speech = strings[tag].replace("-", ",")
+        part_of_speech += ",*" * (3 - part_of_speech.count(",")) + "," + (inf if inf else "*,*")
+        iob = iob_strings[ent_iob]
+        token_lines.append("{}\t{},{},{},{}\t{}\n".format(
+            orth,
+            part_of_speech,
+            strings[lemma],
+            reading if reading else orth,
+            "*",
+            "O" if iob == "O" else "{}-{}".format(iob, strings[ent_type]),
+        ))
+
+    lines = []
+    for sent in doc.sents:
+        start = sent.start
+        end = sent.end
+        if any(not start <= heads[i] < end for i in range(start, end)):
+            # format_cabocha() fails for the heads out of the sentence
+            lines.append(format_cabocha(sent, use_normalized_form))
+            continue
+        # the bunsetu index of each token in the sentence, -1 for the tokens before the first bunsetu
+        bunsetu_index_list = []
+        bunsetu_starts = []
+        for i in range(start, end):
+            if bunsetu_bi[i] == "B":
+                bunsetu_starts.append(i)
+            bunsetu_index_list.append(len(bunsetu_starts) - 1)
+        lines.extend(token_lines[start:bunsetu_starts[0] if bunsetu_starts else end])
+        for bunsetu_index, bunsetu_start in enumerate(bunsetu_starts):
+            bunsetu_end = bunsetu_starts[bunsetu_index + 1] if bunsetu_index + 1 < len(bunsetu_starts) else end
+            bunsetu_head_index = 0
+            bunsetu_dep_index = -1
+            bunsetu_func_index = None
+            for i in range(bunsetu_start, bunsetu_end):
+                tbi = bunsetu_index_list[heads[i] - start]
+                if tbi != bunsetu_index:
+                    bunsetu_head_index = i - bunsetu_start
+                    bunsetu_dep_index = tbi
+                if bunsetu_func_index is None and position_types[i] in {"FUNC", "SYN_HEAD"}:
+                    bunsetu_func_index = i - bunsetu_start
+            if bunsetu_func_index is None:
+                # format_cabocha() takes the length of the sentence minus the token index in the doc for the last bunsetu
+                bunsetu_func_index = bunsetu_end - bunsetu_start if bunsetu_end < end else end - start - bunsetu_start
+            lines.append(f"* {bunsetu_index} {bunsetu_dep_index}D {bunsetu_head_index}/{bunsetu_func_index} 0.000000\n")
+            lines.extend(token_lines[bunsetu_start:bunsetu_end])
+        lines.append("EOS\n\n")
+    return "".join(lines)
+
+
 def cabocha_bunsetu_line(sent: Span, bunsetu_index_list, token) -> str:
     bunsetu_head_index = None
     bunsetu_dep_index = None
@@ -311,8 +609,27 @@ def cabocha_token_line(token, use_normalized_form) -> str:
     )
 
 
-def format_mecab(sudachipy_tokens, use_normalized_form) -> str:
-    return "".join(mecab_token_line(t, use_normalized_form) for t in sudachipy_tokens) + "EOS\n\n"
+def format_mecab(sudachipy_tokens, use_normalized_form, pos_cache: Optional[Dict[int, str]] = None) -> str:
+    """If pos_cache is given, the joined part of speech is looked up by the part of speech id of the morpheme,
+    and the lines are built inline instead of calling mecab_token_line() for each morpheme."""
+    if pos_cache is None:
+        return "".join(mecab_token_line(t, use_normalized_form) for t in sudachipy_tokens) + "EOS\n\n"
+    lines = []
+    for token in sudachipy_tokens:
+        pos_id = token.part_of_speech_id()
+        part_of_speech = pos_cache.get(pos_id)
+        if part_of_speech is None:
+            part_of_speech = pos_cache[pos_id] = ",".join(token.part_of_speech())
+        surface = token.surface()
+        reading = token.reading_form()
+        lines.append("{}\t{},{},{},*\n".format(
+            surface,
+            part_of_speech,
+            token.normalized_form() if use_normalized_form else token.dictionary_form(),
+            reading if reading else surface,
+        ))
+    lines.append("EOS\n\n")
+    return "".join(lines)
 
 
 def mecab_token_line(token, use_normalized_form) -> str:
@@ -0,0 +1,316 @@
+# coding: utf8
+import gc
+from multiprocessing import get_all_start_methods, get_context
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from typing import Generator, Iterable, List, Optional, Tuple, Union
+
+from .analyzer import Analyzer
+
+__all__ = [
+    "AnalyzerPool",
+    "RESULT_TRANSPORTS",
+]
+
+
+RESULT_TRANSPORTS = ("queue", "shm")
+SHM_DIR = "/dev/shm"
+
+
+class AnalyzerPool:
+    """Keeps `processes` warm analyze processes and feeds them mini-batches.
+
+    The worker processes load the pipeline once and stay alive until `close()` is called,
+    so that `analyze_batches()` can be called repeatedly (e.g. once per input file)
+    without paying the model loading cost again.
+
+    With transport="shm", the workers write each result into a segment file on the shared memory
+    file system and only the mini-batch index goes through the result queue. The results are then
+    yielded as UTF-8 encoded bytes, read in the input order, instead of str.
+
+    At most `max_pending` mini-batches (default: 4 per process) are queued, being analyzed or
+    waiting for reordering at a time, so a slow mini-batch holds back the loader instead of
+    letting the other workers flood the memory of the reader with results.
+
+    >>> with AnalyzerPool(analyzer, 4) as pool:
+    ...     for path in paths:
+    ...         for result in pool.analyze_batches(mini_batches(path)):
+    ...             print(result, end="")
+    """
+
+    def __init__(
+        self,
+        analyzer: Analyzer,
+        processes: int,
+        share_model: bool = False,
+        transport: str = "queue",
+        max_pending: Optional[int] = None,
+    ) -> None:
+        assert processes >= 1, "processes should be a positive integer"
+        assert not share_model or "fork" in get_all_start_methods(), "share_model requires the fork start method of multiprocessing."
+        assert transport in RESULT_TRANSPORTS, f"transport should be one of {RESULT_TRANSPORTS}"
+        assert max_pending is None or max_pending > processes, "max_pending should be larger than processes"
+        self.analyzer = analyzer
+        self.processes = processes
+        self.share_model = share_model
+        self.transport = transport
+        self.max_pending = max_pending if max_pending else processes * 4
+        self._workers = []
+        self._segment_dir = None
+        self._in_queue = None
+        self._out_queue = None
+        self._abort = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *_args):
+        self.close()
+
+    @property
+    def started(self) -> bool:
+        return bool(self._workers)
+
+    def start(self) -> None:
+        if self._workers:
+            return
+        if self.share_model:
+            # fork-after-load: the workers share the read-only pages of the pipeline loaded here
+            self.analyzer.set_nlp()
+            gc.freeze()
+            context = get_context("fork")
+        else:
+            context = get_context()
+        self._in_queue = context.Queue(maxsize=self.processes * 2)
+        # the pending semaphore keeps the results below max_pending, the rest is for the control messages
+        self._out_queue = context.Queue(maxsize=self.max_pending + self.processes + 1)
+        self._abort = context.Event()
+        if self.transport == "shm":
+            self._segment_dir = tempfile.TemporaryDirectory(prefix="ginza-", dir=SHM_DIR if os.path.isdir(SHM_DIR) else None)
+            segment_dir = self._segment_dir.name
+        else:
+            segment_dir = None
+        for worker_index in range(self.processes):
+            p = context.Process(
+                target=_multi_process_analyze,
+                args=(self.analyzer, self._in_queue, self._out_queue, self._abort, worker_index, segment_dir),
+                daemon=True,
+            )
+            p.start()
+            self._workers.append(p)
+        if self.share_model:
+            gc.unfreeze()
+
+    def close(self) -> None:
+        if not self._workers:
+            return
+        if not self._abort.is_set():
+            for _ in self._workers:
+                self._in_queue.put("terminate")
+        for p in self._workers:
+            p.join(timeout=1)
+            if p.is_alive():
+                p.terminate()
+                p.join()
+        self._workers = []
+        if self._segment_dir:
+            self._segment_dir.cleanup()
+            self._segment_dir = None
+
+    def terminate(self) -> None:
+        if self._workers:
+            self._abort.set()
+            self.close()
+
+    def analyze_batches(self, batches: Iterable[List[str]], batch_sizer=None) -> Generator[Union[str, bytes], None, None]:
+        """Analyzes the mini-batches with the worker processes and yields the results in the input order.
+
+        If batch_sizer is given, its update(n_chars, elapsed) is called with the analysis time of each mini-batch
+        measured in the worker processes, so that the producer of the batches can adapt the size of the following ones.
+        """
+        for _, result in self._analyze(batches, batch_sizer, ordered=True):
+            yield result
+
+    def analyze_batches_unordered(self, batches: Iterable[List[str]], batch_sizer=None) -> Generator[Tuple[int, Union[str, bytes]], None, None]:
+        """Same as analyze_batches() but yields (mini_batch_index, result) as soon as each mini-batch is analyzed."""
+        yield from self._analyze(batches, batch_sizer, ordered=False)
+
+    def _analyze(self, batches, batch_sizer, ordered: bool) -> Generator[Tuple[int, Union[str, bytes]], None, None]:
+        self.start()
+        pending = threading.BoundedSemaphore(self.max_pending)
+        loader = threading.Thread(
+            target=_load,
+            args=(self._in_queue, self._out_queue, batches, self._abort, pending, self.analyzer.profiler),
+            daemon=True,
+        )
+        loader.start()
+        completed = False
+        try:
+            yield from self._results(batch_sizer, pending, ordered)
+            completed = True
+        finally:
+            if not completed:
+                # the results in flight can not be reused by the next call
+                self.terminate()
+            loader.join()
+
+    def _results(self, batch_sizer, pending, ordered: bool) -> Generator[Tuple[int, Union[str, bytes]], None, None]:
+        cur = 0
+        n_received = 0
+        results = dict()
+        n_batches = None
+        aborted = False
+        profiler = self.analyzer.profiler
+        while n_batches is None or n_received < n_batches:
+            wait_start = time.perf_counter()
+            try:
+                # waits a little longer after an abort to receive the error message from the worker
+                msg, mini_batch_index, result, stats = self._out_queue.get(timeout=1 if aborted else 0.1)
+            except queue.Empty:
+                if aborted:
+                    raise RuntimeError("Analyze process terminated unexpectedly.")
+                aborted = self._abort.is_set() or not all(p.is_alive() for p in self._workers)
+                continue
+            finally:
+                if profiler:
+                    profiler.wait("reader out_queue.get", time.perf_counter() - wait_start)
+
+            if msg is not None:
+                if msg == "loaded":
+                    n_batches = mini_batch_index
+                    continue
+                else:
+                    print(f"Analysis failed in mini_batch #{mini_batch_index}. Stopping all the processes.", file=sys.stderr)
+                    print(msg, file=sys.stderr)
+                    raise RuntimeError(f"Analysis failed in mini_batch #{mini_batch_index}")
+
+            n_received += 1
+            n_chars, elapsed, profile = stats
+            if batch_sizer is not None:
+                batch_sizer.update(n_chars, elapsed)
+            if profiler and profile:
+                profiler.merge(profile)
+
+            if not ordered:
+                if self._segment_dir:
+                    result = _read_segment(self._segment_dir.name, mini_batch_index)
+                pending.release()
+                yield mini_batch_index, result
+                continue
+
+            # output must be ordered same as input text
+            results[mini_batch_index] = result
+            while cur in results:
+                result = results.pop(cur)
+                if self._segment_dir:
+                    result = _read_segment(self._segment_dir.name, cur)
+                pending.release()
+                yield cur, result
+                cur += 1
+
+
+def _load(in_queue, out_queue, batches: Iterable[List[str]], abort, pending, profiler=None) -> None:
+    n_batches = 0
+    try:
+        for i, mini_batch in enumerate(batches):
+            # backpressure: waits until the reader consumes one of the pending results
+            wait_start = time.perf_counter()
+            while not abort.is_set():
+                if pending.acquire(timeout=0.1):
+                    break
+            else:
+                return
+            put_start = time.perf_counter()
+            while not abort.is_set():
+                try:
+                    in_queue.put((i, mini_batch), timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            else:
+                return
+            if profiler:
+                profiler.wait("loader backpressure", put_start - wait_start)
+                profiler.wait("loader in_queue.put", time.perf_counter() - put_start)
+            n_batches = i + 1
+        out_queue.put(("loaded", n_batches, None, None))
+    except Exception as err:
+        traceback.print_exc()
+        out_queue.put(("Error: {}".format(err), n_batches, None, None))
+
+
+def _segment_path(segment_dir: str, mini_batch_index: int) -> str:
+    return os.path.join(segment_dir, str(mini_batch_index))
+
+
+def _write_segment(segment_dir: str, mini_batch_index: int, result: Union[str, bytes]) -> None:
+    with open(_segment_path(segment_dir, mini_batch_index), "wb") as f:
+        f.write(result.encode("utf-8") if isinstance(result, str) else result)
+
+
+def _read_segment(segment_dir: str, mini_batch_index: int) -> bytes:
+    path = _segment_path(segment_dir, mini_batch_index)
+    with open(path, "rb") as f:
+        result = f.read()
+    os.unlink(path)
+    return result
+
+
+def _memory_usage() -> str:
+    try:
+        # Pss splits the pages shared between the workers, so it shows the actual cost of each process
+        with open("/proc/self/smaps_rollup", "r") as f:
+            usage = dict(line.split()[:2] for line in f if line.split()[0] in ("Rss:", "Pss:", "Shared_Clean:", "Shared_Dirty:"))
+        shared = int(usage["Shared_Clean:"]) + int(usage["Shared_Dirty:"])
+        return "rss={:.1f}MB pss={:.1f}MB shared={:.1f}MB".format(int(usage["Rss:"]) / 1024, int(usage["Pss:"]) / 1024, shared / 1024)
+    except (OSError, KeyError, ValueError):
+        import resource
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return "max_rss={:.1f}MB".format(max_rss / (1024 * 1024 if sys.platform == "darwin" else 1024))
+
+
+def _multi_process_analyze(analyzer: Analyzer, in_queue, out_queue, abort, worker_index: int = 0, segment_dir: Optional[str] = None):
+    i = None
+    mini_batch = []
+    try:
+        analyzer.set_nlp()
+        print(f"analyze process #{worker_index} (pid={os.getpid()}) started: {_memory_usage()}", file=sys.stderr)
+        profiler = analyzer.profiler
+        wait_start = time.perf_counter()
+        while True:
+            if abort.is_set():
+                break
+            try:
+                msg = in_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if msg == "terminate":
+                break
+            i, mini_batch = msg
+            start = time.perf_counter()
+            if profiler:
+                profiler.wait(f"worker#{worker_index} in_queue.get", start - wait_start)
+            result = analyzer.analyze_batch(mini_batch)
+            elapsed = time.perf_counter() - start
+            if segment_dir:
+                _write_segment(segment_dir, i, result)
+                result = None
+            # the wait for out_queue.put() of a mini-batch is reported with the next one
+            profile = profiler.pop() if profiler else None
+            put_start = time.perf_counter()
+            out_queue.put((None, i, result, (sum(len(line) for line in mini_batch), elapsed, profile)))
+            wait_start = time.perf_counter()
+            if profiler:
+                profiler.wait(f"worker#{worker_index} out_queue.put", wait_start - put_start)
+    except KeyboardInterrupt:
+        pass
+    except Exception as err:
+        out_queue.put(("Error: {}\n{}".format(err, "".join(mini_batch)), i, None, None))
+        traceback.print_exc()
+        abort.set()
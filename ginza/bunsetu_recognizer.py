@@ -1,6 +1,10 @@
+from bisect import bisect_left, bisect_right
 import re
-from typing import Dict, Iterable, List, Optional, Set
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
+import numpy
+
+from spacy.attrs import DEP, HEAD, IS_PUNCT, IS_SPACE, LEMMA, NORM, ORTH, POS, SENT_START, TAG
 from spacy.language import Language
 from spacy.tokens import Doc, Span, Token
 
@@ -22,6 +26,7 @@ __all__ = [
     "clauses",
     "clause_head",
     "clause_head_i",
+    "clause_head_list",
     "CLAUSE_MARKER_RULES",
     "MIN_BUNSETU_NUM_IN_CLAUSE",
 ]
@@ -66,20 +71,24 @@ def bunsetu_head_list(span: Span) -> Iterable[int]:
         return heads
     else:
         start = span.start
-        end = span.end
-        return [i - start for i in heads if start <= i < end]
+        lo, hi = _bunsetu_head_range(heads, span)
+        return [i - start for i in heads[lo:hi]]
 
 
 def bunsetu_head_tokens(span: Span) -> Iterable[Token]:
     doc = span.doc
     heads = doc.user_data["bunsetu_heads"]
     if isinstance(span, Doc):
-        start = 0
-        end = len(span)
+        return [doc[i] for i in heads]
     else:
-        start = span.start
-        end = span.end
-    return [span[i - start] for i in heads if start <= i < end]
+        lo, hi = _bunsetu_head_range(heads, span)
+        return [doc[i] for i in heads[lo:hi]]
+
+
+def _bunsetu_head_range(heads: Iterable[int], span: Span) -> Tuple[int, int]:
+    # bunsetu_heads is sorted, so the heads in the span are a slice of it
+    lo = bisect_left(heads, span.start)
+    return lo, bisect_left(heads, span.end, lo)
 
 
 def bunsetu_spans(span: Span) -> Iterable[Span]:
@@ -89,16 +98,22 @@ def bunsetu_spans(span: Span) -> Iterable[Span]:
 
 
 def bunsetu_span(token: Token) -> Span:
-    bunsetu_bi_list = bunsetu_bi_labels(token.doc)
+    doc = token.doc
+    entry = _bunsetu_span_entry(token)
+    if entry is not None:
+        start, end, root, _, _ = entry
+        return Span(doc, start=start, end=end, label=POS_PHRASE_MAP.get(doc[root].pos_, ""))
+
+    bunsetu_bi_list = bunsetu_bi_labels(doc)
     start = token.i
     end = start + 1
     for idx in range(start, 0, -1):
-        if bunsetu_bi_list[idx] == "B" or token.doc[idx].is_sent_start:
+        if bunsetu_bi_list[idx] == "B" or doc[idx].is_sent_start:
             start = idx
             break
     else:
         start = 0
-    doc_len = len(token.doc)
+    doc_len = len(doc)
     for idx in range(end, doc_len):
         if bunsetu_bi_list[idx] == "B":
             end = idx
@@ -106,7 +121,6 @@ def bunsetu_span(token: Token) -> Span:
     else:
         end = doc_len
 
-    doc = token.doc
     return Span(doc, start=start, end=end, label=POS_PHRASE_MAP.get(doc[start:end].root.pos_, ""))
 
 
@@ -117,6 +131,12 @@ def bunsetu_phrase_spans(span: Span, phrase_relations: Iterable[str] = PHRASE_RE
 
 
 def bunsetu_phrase_span(token: Token, phrase_relations: Iterable[str] = PHRASE_RELATIONS) -> Span:
+    doc = token.doc
+    entry = _bunsetu_span_entry(token)
+    if entry is not None and tuple(phrase_relations) == PHRASE_RELATIONS:
+        _, _, root, phrase_start, phrase_end = entry
+        return Span(doc, start=phrase_start, end=phrase_end, label=POS_PHRASE_MAP.get(doc[root].pos_, ""))
+
     def _traverse(head, _bunsetu, result):
         for t in head.children:
             if _bunsetu.start <= t.i < _bunsetu.end:
@@ -128,7 +148,16 @@ def bunsetu_phrase_span(token: Token, phrase_relations: Iterable[str] = PHRASE_R
     _traverse(bunsetu.root, bunsetu, phrase_tokens)
     start = min(phrase_tokens)
     end = max(phrase_tokens) + 1
-    return Span(token.doc, start=start, end=end, label=bunsetu.label_)
+    return Span(doc, start=start, end=end, label=bunsetu.label_)
+
+
+def _bunsetu_span_entry(token: Token) -> Optional[Tuple[int, int, int, int, int]]:
+    # (start, end, root, phrase_start, phrase_end) of the bunsetu of the token, None if the doc has no index
+    user_data = token.doc.user_data
+    span_ids = user_data.get("bunsetu_span_ids")
+    if span_ids is None or len(span_ids) != len(token.doc):
+        return None
+    return user_data["bunsetu_span_index"][span_ids[token.i]]
 
 
 def bunsetu_bi_labels(span: Span) -> List[str]:
@@ -162,9 +191,23 @@ def clause_head(token: Token) -> Token:
     return token.doc[token.doc.user_data["clause_heads"][token.i]]
 
 
-def clause_head_i(token: Token) -> int:
+def clause_head_i(token: Token, sent_start: Optional[int] = None) -> int:
+    # token.sent scans for the sentence boundaries, so pass sent_start if the sentence is already known
     doc = token.doc
-    return doc.user_data["clause_heads"][token.i] - token.sent.start
+    if sent_start is None:
+        sent_start = token.sent.start
+    return doc.user_data["clause_heads"][token.i] - sent_start
+
+
+def clause_head_list(span: Span) -> List[int]:
+    doc = span.doc
+    clause_heads = doc.user_data["clause_heads"]
+    if isinstance(span, Doc):
+        return clause_heads
+    else:
+        start = span.start
+        end = span.end
+        return [head - start for head in clause_heads[start:end]]
 
 
 class BunsetuRecognizer:
@@ -205,156 +248,195 @@ class BunsetuRecognizer:
         self._min_bunsetu_num_in_clause = _min_bunsetu_num_in_clause
 
     def __call__(self, doc: Doc) -> Doc:
-        debug = False
-        heads = [False] * len(doc)
-        for t in doc:
-            if t.dep_ == "ROOT":
-                heads[t.i] = True
-            elif t.dep_.endswith(BUNSETU_HEAD_SUFFIX):
-                heads[t.i] = True
+        length = len(doc)
+        strings = doc.vocab.strings
+        array = doc.to_array([HEAD, DEP, POS, SENT_START, IS_PUNCT, IS_SPACE])
+        heads_i = (numpy.arange(length, dtype="int64") + array[:, 0].astype("int64")).tolist()
+        deps = [strings[dep] for dep in array[:, 1].tolist()]
+        pos = [strings[_] for _ in array[:, 2].tolist()]
+        sent_starts = (array[:, 3] == 1).tolist()
+        # the edges are taken from spaCy since Token.children etc. depend on them
+        edges = [(t.left_edge.i, t.right_edge.i) for t in doc]
+        tree = _DependencyTree(heads_i, [_[0] for _ in edges], [_[1] for _ in edges])
+
+        heads = [False] * length
+        for i, dep in enumerate(deps):
+            if dep == "ROOT":
+                heads[i] = True
+            elif dep.endswith(BUNSETU_HEAD_SUFFIX):
+                heads[i] = True
                 if not self._remain_bunsetu_suffix:
-                    t.dep_ = t.dep_[:-len(BUNSETU_HEAD_SUFFIX)]
-        for t in doc:  # recovering uncovered subtrees
-            if heads[t.i]:
-                while t.head.i < t.i and not heads[t.head.i]:
-                    heads[t.head.i] = t.head.pos_ not in {"PUNCT"}
-                    if debug and heads[t.head.i]:
-                        print("========= A", t.i + 1, t.orth_, "=========")
-                        print(list((t.i + 1, t.orth_, t.head.i + 1) for t, is_head in zip(doc, heads) if is_head))
-                    t = t.head
-                heads[t.head.i] = True
+                    deps[i] = dep[:-len(BUNSETU_HEAD_SUFFIX)]
+                    doc[i].dep_ = deps[i]
+        for i in range(length):  # recovering uncovered subtrees
+            if heads[i]:
+                while heads_i[i] < i and not heads[heads_i[i]]:
+                    heads[heads_i[i]] = pos[heads_i[i]] not in {"PUNCT"}
+                    i = heads_i[i]
+                heads[heads_i[i]] = True
 
         for ent in doc.ents:  # removing head inside ents
             head = None
             outer = None
-            for t in ent:
-                if t.head.i == t.i or t.head.i < ent.start or ent.end <= t.head.i:
-                    if not outer:
-                        head = t
-                        outer = t.head
-                    elif outer.i != t.head.i:
+            for i in range(ent.start, ent.end):
+                if heads_i[i] == i or heads_i[i] < ent.start or ent.end <= heads_i[i]:
+                    if outer is None:
+                        head = i
+                        outer = heads_i[i]
+                    elif outer != heads_i[i]:
                         break
             else:
-                if head:
-                    for t in ent:
-                        if t.i != head.i:
-                            heads[t.i] = False
+                if head is not None:
+                    for i in range(ent.start, ent.end):
+                        if i != head:
+                            heads[i] = False
 
         bunsetu_heads = tuple(idx for idx, is_head in enumerate(heads) if is_head)
 
-        bunsetu_bi = ["I"] * len(doc)
+        left_edges = tree.left_edges
+        right_edges = tree.right_edges
+        bunsetu_bi = ["I"] * length
         if bunsetu_bi:
             bunsetu_bi[0] = "B"
-        for head_i, next_head_i in zip(bunsetu_heads[:-1], bunsetu_heads[1:]):
-            l_head = doc[head_i]
-            r_head = doc[next_head_i]
-            if l_head.right_edge.i + 1 == r_head.left_edge.i or l_head.right_edge.i >= r_head.i:  # (l)(r) or (l (r))
-                bunsetu_bi[r_head.left_edge.i] = "B"
-            elif l_head.i <= r_head.left_edge.i:  # ((l) r)
-                bunsetu_bi[l_head.right_edge.i + 1] = "B"
+        for l_head, r_head in zip(bunsetu_heads[:-1], bunsetu_heads[1:]):
+            l_right_edge = right_edges[l_head]
+            r_left_edge = left_edges[r_head]
+            if l_right_edge + 1 == r_left_edge or l_right_edge >= r_head:  # (l)(r) or (l (r))
+                bunsetu_bi[r_left_edge] = "B"
+            elif l_head <= r_left_edge:  # ((l) r)
+                bunsetu_bi[l_right_edge + 1] = "B"
             else:  # ((l) (missed_tokens) (r))
-                l_ancestors = set(t.i for t in l_head.ancestors)
-                r_ancestors = set(t.i for t in r_head.ancestors)
-                for m in doc[l_head.right_edge.i + 1: r_head.left_edge.i]:  # find closer branch
+                l_ancestors = set(tree.ancestors(l_head))
+                r_ancestors = set(tree.ancestors(r_head))
+                for m in range(l_right_edge + 1, r_left_edge):  # find closer branch
                     found = False
-                    for m_ancestor in [m] + list(m.ancestors):
-                        if m_ancestor.i in r_ancestors:
-                            bunsetu_bi[m_ancestor.i] = "B"
+                    for m_ancestor in [m] + tree.ancestors(m):
+                        if m_ancestor in r_ancestors:
+                            bunsetu_bi[m_ancestor] = "B"
                             found = True
                             break
-                        elif m_ancestor.i in l_ancestors:
+                        elif m_ancestor in l_ancestors:
                             break
                     if found:
                         break
                 else:
-                    bunsetu_bi[l_head.right_edge.i + 1] = "B"
+                    bunsetu_bi[l_right_edge + 1] = "B"
 
         doc.user_data["bunsetu_heads"] = bunsetu_heads
+        doc.user_data["bunsetu_head_flags"] = heads
         doc.user_data["bunsetu_bi_labels"] = bunsetu_bi
 
-        position_types = [None] * len(doc)
+        # Span.root does not take a punctuation or a space without children if possible
+        leaves = [
+            bool(is_punct or is_space) and doc[i].n_lefts == 0 and doc[i].n_rights == 0
+            for i, (is_punct, is_space) in enumerate(array[:, 4:6].tolist())
+        ]
+        span_ids, span_index = _build_bunsetu_span_index(doc, bunsetu_bi, sent_starts, deps, tree, leaves)
+        doc.user_data["bunsetu_span_ids"] = span_ids
+        doc.user_data["bunsetu_span_index"] = span_index
+
+        position_types = [None] * length
         for head in bunsetu_heads:
-            phrase = bunsetu_phrase_span(doc[head])
-            for t in phrase:
-                if t.i == t.head.i:
-                    position_types[t.i] = "ROOT"
-                elif t.i == head:
-                    position_types[t.i] = "NO_HEAD" if t.dep_ == "punct" else "SEM_HEAD"
+            _, _, _, phrase_start, phrase_end = span_index[span_ids[head]]
+            for i in range(phrase_start, phrase_end):
+                if i == heads_i[i]:
+                    position_types[i] = "ROOT"
+                elif i == head:
+                    position_types[i] = "NO_HEAD" if deps[i] == "punct" else "SEM_HEAD"
                 else:
-                    position_types[t.i] = "CONT"
+                    position_types[i] = "CONT"
         first_func = True
-        for t, bi, position_type in reversed(list(zip(doc, bunsetu_bi, position_types))):
+        for i, bi, position_type in reversed(list(zip(range(length), bunsetu_bi, position_types))):
             if bi:
                 first_func = True
             if position_type is None:
-                if t.pos_ in {'AUX', 'ADP', 'SCONJ', 'CCONJ', 'PART'}:
+                if pos[i] in {'AUX', 'ADP', 'SCONJ', 'CCONJ', 'PART'}:
                     if first_func:
-                        position_types[t.i] = "SYN_HEAD"
+                        position_types[i] = "SYN_HEAD"
                         first_func = False
                     else:
-                        position_types[t.i] = "FUNC"
+                        position_types[i] = "FUNC"
                 else:
-                    position_types[t.i] = "CONT"
+                    position_types[i] = "CONT"
         doc.user_data["bunsetu_position_types"] = position_types
 
         bunsetu_heads_set = set(bunsetu_heads)
         clause_head_candidates = set()
         roots = set()
-        for t in doc:
-            for rule in self._clause_marker_rules:
-                if t.dep_.lower() == "root":
-                    roots.add(t.i)
+        rule_values = [
+            {attr: _token_attr_values(doc, attr, deps, pos) for attr in rule} for rule in self._clause_marker_rules
+        ]
+        for i in range(length):
+            for rule, values in zip(self._clause_marker_rules, rule_values):
+                if deps[i].lower() == "root":
+                    roots.add(i)
                     continue
                 for attr, pattern in rule.items():
-                    if not pattern.fullmatch(getattr(t, attr)):
+                    if not pattern.fullmatch(values[attr][i]):
                         break
                 else:
-                    if t.i in bunsetu_heads_set:
-                        clause_head_candidates.add(t.i)
+                    if i in bunsetu_heads_set:
+                        clause_head_candidates.add(i)
                     else:
-                        for ancestor in t.ancestors:
-                            if ancestor.i in bunsetu_heads_set:
-                                clause_head_candidates.add(t.head.i)
+                        for ancestor in tree.ancestors(i):
+                            if ancestor in bunsetu_heads_set:
+                                clause_head_candidates.add(heads_i[i])
                                 break
                     break
         clause_head_candidates -= roots
 
+        bunsetu_count = tree.subtree_counter(heads)
         for clause_head in list(sorted(clause_head_candidates)):
-            subtree = set(_.i for _ in doc[clause_head].subtree)
-            if len(subtree & bunsetu_heads_set) < self._min_bunsetu_num_in_clause:
+            if bunsetu_count(clause_head) < self._min_bunsetu_num_in_clause:
                 clause_head_candidates.remove(clause_head)
 
         clause_head_candidates |= roots
+        # the pre-order indices of the candidates, in which the descendants of a token are contiguous
+        candidate_orders = sorted(tree.order_index[c] for c in clause_head_candidates)
         for clause_head in list(sorted(clause_head_candidates)):
-            subtree = set(_.i for _ in doc[clause_head].subtree)
-            subtree_bunsetu = subtree & bunsetu_heads_set
-            descendant_clauses = subtree & clause_head_candidates - {clause_head}
+            index = tree.order_index[clause_head]
+            lo = bisect_right(candidate_orders, index)
+            hi = bisect_left(candidate_orders, index + tree.subtree_sizes[clause_head], lo)
+            descendant_clauses = [tree.order[_] for _ in candidate_orders[lo:hi]]
+            n_subtree_bunsetu = bunsetu_count(clause_head)
+            # the subtrees are either nested or disjoint, so only the outermost ones are subtracted
+            outer_end = -1
             for subclause in descendant_clauses:
-                subtree_bunsetu -= set(_.i for _ in doc[subclause].subtree)
-            if len(subtree_bunsetu) < self._min_bunsetu_num_in_clause:
+                if tree.order_index[subclause] >= outer_end:
+                    n_subtree_bunsetu -= bunsetu_count(subclause)
+                    outer_end = tree.order_index[subclause] + tree.subtree_sizes[subclause]
+            if n_subtree_bunsetu < self._min_bunsetu_num_in_clause:
                 if clause_head in roots:
-                    clause_head_candidates -= descendant_clauses
+                    clause_head_candidates -= set(descendant_clauses)
+                    del candidate_orders[lo:hi]
                 else:
                     clause_head_candidates.remove(clause_head)
-        
+                    del candidate_orders[bisect_left(candidate_orders, index)]
+
         clause_heads = list(sorted(clause_head_candidates))
+        clause_heads_set = set(clause_heads)
 
         def _children_except_clause_heads(idx):
+            # in-order traversal which does not enter the subtrees of the other clauses
             children = []
-            for t in doc[idx].lefts:
-                if t.i in clause_heads:
+            stack = [(idx, False)]
+            while stack:
+                i, visited = stack.pop()
+                if visited:
+                    children.append(i)
                     continue
-                children += _children_except_clause_heads(t.i)
-            children.append(idx)
-            for t in doc[idx].rights:
-                if t.i in clause_heads:
-                    continue
-                children += _children_except_clause_heads(t.i)
+                for t in reversed(tree.children[i]):
+                    if t > i and t not in clause_heads_set:
+                        stack.append((t, False))
+                stack.append((i, True))
+                for t in reversed(tree.children[i]):
+                    if t < i and t not in clause_heads_set:
+                        stack.append((t, False))
             return children
 
         clauses = {head: _children_except_clause_heads(head) for head in clause_heads}
         doc.user_data["clauses"] = clauses
-        clause_heads = [-1] * len(doc)
+        clause_heads = [-1] * length
         for head, tokens in clauses.items():
             for token in tokens:
                 clause_heads[token] = head
@@ -362,6 +444,155 @@ class BunsetuRecognizer:
         return doc
 
 
+class _DependencyTree:
+    """Index of the dependency tree given by the absolute head positions.
+
+    If left_edges and right_edges are given, the children out of the edges are ignored
+    in the same way as Token.children, Token.subtree, etc. of spaCy do.
+    The tokens are numbered in the depth-first pre-order, so that the subtree of a token is
+    the interval [order_index[i], order_index[i] + subtree_sizes[i]) of the pre-order.
+    """
+
+    def __init__(self, heads: List[int], left_edges: Optional[List[int]] = None, right_edges: Optional[List[int]] = None) -> None:
+        length = len(heads)
+        self.heads = heads
+        self.children = [[] for _ in range(length)]
+        roots = []
+        for i, head in enumerate(heads):
+            if head == i or left_edges and not left_edges[head] <= i <= right_edges[head]:
+                roots.append(i)
+            else:
+                self.children[head].append(i)
+        self.order = []
+        stack = list(reversed(roots))
+        while stack:
+            i = stack.pop()
+            self.order.append(i)
+            for child in reversed(self.children[i]):
+                stack.append(child)
+        self.order_index = [0] * length
+        for index, i in enumerate(self.order):
+            self.order_index[i] = index
+        self.subtree_sizes = [1] * length
+        for i in reversed(self.order):
+            for child in self.children[i]:
+                self.subtree_sizes[i] += self.subtree_sizes[child]
+        if left_edges:
+            self.left_edges = left_edges
+            self.right_edges = right_edges
+        else:
+            self.left_edges = list(range(length))
+            self.right_edges = list(range(length))
+            for i in reversed(self.order):
+                for child in self.children[i]:
+                    if self.left_edges[child] < self.left_edges[i]:
+                        self.left_edges[i] = self.left_edges[child]
+                    if self.right_edges[child] > self.right_edges[i]:
+                        self.right_edges[i] = self.right_edges[child]
+
+    def ancestors(self, i: int) -> List[int]:
+        ancestors = []
+        while self.heads[i] != i and len(ancestors) < len(self.heads):
+            i = self.heads[i]
+            ancestors.append(i)
+        return ancestors
+
+    def subtree_counter(self, flags: List[bool]):
+        """Returns a function which counts the tokens with the flag in the subtree of a token (including itself)."""
+        prefix_sums = [0]
+        for i in self.order:
+            prefix_sums.append(prefix_sums[-1] + (1 if flags[i] else 0))
+
+        def count(i: int) -> int:
+            index = self.order_index[i]
+            return prefix_sums[index + self.subtree_sizes[i]] - prefix_sums[index]
+
+        return count
+
+
+def _build_bunsetu_span_index(
+    doc: Doc,
+    bunsetu_bi: List[str],
+    sent_starts: List[bool],
+    deps: List[str],
+    tree: _DependencyTree,
+    leaves: List[bool],
+) -> Tuple[List[int], Tuple[Tuple[int, int, int, int, int], ...]]:
+    """Returns the bunsetu index of each token and (start, end, root, phrase_start, phrase_end) of each bunsetu.
+
+    The spans are the same as the ones bunsetu_span() and bunsetu_phrase_span() find by scanning the labels:
+    a bunsetu starts at a "B" label or at a sentence start, and ends just before the next "B" label.
+    """
+    length = len(bunsetu_bi)
+    ends = [length] * length
+    end = length
+    for i in range(length - 1, -1, -1):
+        ends[i] = end
+        if bunsetu_bi[i] == "B":
+            end = i
+    span_ids = [0] * length
+    span_index = []
+    for i in range(length):
+        if i == 0 or bunsetu_bi[i] == "B" or sent_starts[i]:
+            start = i
+            end = ends[i]
+            root = _span_root(doc, start, end, tree, leaves)
+            phrase_start = phrase_end = root
+            stack = [root]
+            while stack:
+                for child in tree.children[stack.pop()]:
+                    if start <= child < end and deps[child] in PHRASE_RELATIONS:
+                        stack.append(child)
+                        if child < phrase_start:
+                            phrase_start = child
+                        elif child > phrase_end:
+                            phrase_end = child
+            span_index.append((start, end, root, phrase_start, phrase_end + 1))
+        span_ids[i] = len(span_index) - 1
+    return span_ids, tuple(span_index)
+
+
+def _span_root(doc: Doc, start: int, end: int, tree: _DependencyTree, leaves: List[bool]) -> int:
+    # same as Span.root
+    if "root" in doc.user_span_hooks:
+        return doc[start:end].root.i
+    heads = tree.heads
+    for i in range(start, end):
+        if heads[i] == i:
+            return i
+    current_best = len(doc)
+    root = -1
+    for i in range(start, end):
+        if start <= heads[i] < end:
+            continue
+        words_to_root = len(doc) - 1 if leaves[i] else len(tree.ancestors(i))
+        if words_to_root < current_best:
+            current_best = words_to_root
+            root = i
+    return start if root == -1 else root
+
+
+_TOKEN_ATTR_IDS = {
+    "orth_": ORTH,
+    "text": ORTH,
+    "tag_": TAG,
+    "lemma_": LEMMA,
+    "norm_": NORM,
+}
+
+
+def _token_attr_values(doc: Doc, attr: str, deps: List[str], pos: List[str]) -> List:
+    if attr == "dep_":
+        return deps
+    elif attr == "pos_":
+        return pos
+    elif attr in _TOKEN_ATTR_IDS:
+        strings = doc.vocab.strings
+        return [strings[_] for _ in doc.to_array(_TOKEN_ATTR_IDS[attr]).tolist()]
+    else:
+        return [getattr(t, attr) for t in doc]
+
+
 def append_bunsetu_head_dep_suffix(tokens: List[Token], suffix: str = BUNSETU_HEAD_SUFFIX) -> None:
     if not suffix:
         return
@@ -1,16 +1,20 @@
 # coding: utf8
-from multiprocessing import Process, Queue, Event, cpu_count
+from multiprocessing import cpu_count, get_all_start_methods
 from pathlib import Path
-import queue
 import re
 import sys
-import traceback
-from typing import Generator, Iterable, Optional, List
+import time
+from typing import Generator, Iterable, Optional, List, Union
 
 import plac
-from .analyzer import Analyzer
+from .analyzer import Analyzer, format_docs
+from .analyzer_pool import AnalyzerPool, RESULT_TRANSPORTS
 
 MINI_BATCH_SIZE = 100
+MINI_BATCH_CHARS = 5000
+MINI_BATCH_CHARS_RANGE = (200, 200000)
+THROUGHPUT_SMOOTHING = 0.3
+DOCBIN_SHARD_SUFFIX = ".spacy"
 GINZA_MODEL_PATTERN = re.compile(r"^(ja_ginza|ja_ginza_electra)$")
 SPACY_MODEL_PATTERN = re.compile(r"^[a-z]{2}[-_].+[-_].+(sm|md|lg|trf)$")
 
@@ -21,13 +25,21 @@ class _OutputWrapper:
         self.output_path = output_path
         self.output_format = output_format
         self.output_json_opened = False
+        self.n_shards = 0
 
     @property
     def is_json(self):
         return self.output_format in ["3", "json"]
 
+    @property
+    def is_docbin(self):
+        return self.output_format in ["5", "docbin"]
+
     def open(self):
-        if self.output_path:
+        if self.is_docbin:
+            # each mini-batch is stored as a DocBin shard in the output directory
+            Path(self.output_path).mkdir(parents=True, exist_ok=True)
+        elif self.output_path:
             self.output = open(self.output_path, "w", encoding="utf-8")
         else:
             self.output = sys.stdout
@@ -36,21 +48,66 @@ class _OutputWrapper:
         if self.is_json and self.output_json_opened:
             print("\n]", file=self.output)
             self.output_json_opened = False
-        if self.output_path:
+        if self.is_docbin:
+            pass
+        elif self.output_path:
             self.output.close()
         else:
             pass
 
-    def write(self, result: str):
+    def write(self, result: Union[str, bytes]):
+        if self.is_docbin:
+            with open(Path(self.output_path) / f"{self.n_shards:06d}{DOCBIN_SHARD_SUFFIX}", "wb") as f:
+                f.write(result)
+            self.n_shards += 1
+            return
         if self.is_json:
             if not self.output_json_opened:
                 print("[", file=self.output)
                 self.output_json_opened = True
             else:
                 print(",", file=self.output)
+        if isinstance(result, bytes):
+            # encoded results go to the underlying binary buffer without decoding
+            if hasattr(self.output, "buffer"):
+                self.output.flush()
+                self.output.buffer.write(result)
+                return
+            result = result.decode("utf-8")
         print(result, end="", file=self.output)
 
 
+class MiniBatchSizer:
+    """Decides where to cut the input lines into mini-batches.
+
+    By default a mini-batch has `max_lines` lines. If `max_chars` is positive, the lines are packed
+    up to the character budget instead. If `target_latency` is also positive, the budget follows
+    the measured throughput so that the analysis of a mini-batch takes about `target_latency` seconds.
+    """
+
+    def __init__(self, max_lines: int = MINI_BATCH_SIZE, max_chars: int = 0, target_latency: float = 0.0):
+        self.max_lines = max_lines
+        self.max_chars = max_chars
+        self.target_latency = target_latency
+        self.throughput = None
+
+    def is_full(self, n_lines: int, n_chars: int) -> bool:
+        if self.max_chars > 0:
+            return n_chars >= self.max_chars
+        return n_lines >= self.max_lines
+
+    def update(self, n_chars: int, elapsed: float) -> None:
+        if self.max_chars <= 0 or self.target_latency <= 0 or elapsed <= 0:
+            return
+        throughput = n_chars / elapsed
+        if self.throughput is None:
+            self.throughput = throughput
+        else:
+            self.throughput += (throughput - self.throughput) * THROUGHPUT_SMOOTHING
+        min_chars, max_chars = MINI_BATCH_CHARS_RANGE
+        self.max_chars = int(min(max_chars, max(min_chars, self.throughput * self.target_latency)))
+
+
 def run(
     model_path: Optional[str] = None,
     ensure_model: Optional[str] = None,
@@ -63,14 +120,36 @@ def run(
     use_normalized_form: bool = False,
     parallel_level: int = 1,
     files: List[str] = None,
+    share_model: bool = False,
+    analyzer_pool: Optional[AnalyzerPool] = None,
+    batch_chars: int = 0,
+    batch_latency: float = 0.0,
+    result_transport: str = "queue",
+    unordered: bool = False,
+    profile: Optional[str] = None,
+    threads: int = 1,
 ):
+    if analyzer_pool is not None:
+        output_format = analyzer_pool.analyzer.output_format
+
     if output_format in ["3", "json"] and hash_comment != "analyze":
         print(
             f'hash_comment="{hash_comment}" not permitted for JSON output. Forced to use hash_comment="analyze".',
             file=sys.stderr
         )
+    elif output_format in ["4", "jsonl", "5", "docbin"] and hash_comment == "print":
+        output_format_name = "JSON Lines" if output_format in ["4", "jsonl"] else "DocBin"
+        print(
+            f'hash_comment="print" not permitted for {output_format_name} output. Forced to use hash_comment="analyze".',
+            file=sys.stderr
+        )
+        hash_comment = "analyze"
 
     assert parallel_level == 1 or require_gpu == -1, "require_gpu not allowed for multi-processing. https://github.com/explosion/spaCy/issues/5507"
+    assert not share_model or "fork" in get_all_start_methods(), "share_model requires the fork start method of multiprocessing."
+    assert not unordered or output_format not in ["3", "json", "5", "docbin"], "unordered not allowed for JSON or DocBin output."
+    assert output_path or output_format not in ["5", "docbin"], "output_path is required for DocBin output."
+    assert threads >= 1, "threads should be a positive integer"
 
     if parallel_level <= 0:
         level = max(1, cpu_count() + parallel_level)
@@ -91,7 +170,9 @@ def run(
         parallel_level = level
 
     assert model_path is None or ensure_model is None
-    if ensure_model:
+    if analyzer_pool is not None:
+        pass
+    elif ensure_model:
         ensure_model = ensure_model.replace("-", "_")
         try:
             from importlib import import_module
@@ -113,16 +194,26 @@ def run(
     else:
         model_name_or_path = model_path
 
-    analyzer = Analyzer(
-        model_name_or_path,
-        split_mode,
-        hash_comment,
-        output_format,
-        require_gpu,
-        disable_sentencizer,
-        use_normalized_form,
-    )
+    if analyzer_pool is not None:
+        analyzer = analyzer_pool.analyzer
+    else:
+        analyzer = Analyzer(
+            model_name_or_path,
+            split_mode,
+            hash_comment,
+            output_format,
+            require_gpu,
+            disable_sentencizer,
+            use_normalized_form,
+            profile=bool(profile),
+            threads=threads,
+        )
+
+    if batch_latency > 0 and batch_chars <= 0:
+        batch_chars = MINI_BATCH_CHARS
+    batch_sizer = MiniBatchSizer(MINI_BATCH_SIZE, batch_chars, batch_latency)
 
+    start = time.perf_counter()
     output = _OutputWrapper(output_path, output_format)
     output.open()
     try:
@@ -131,13 +222,19 @@ def run(
         else:
             if not files:
                 files = [0]
-            if parallel_level == 1:
-                _analyze_single(analyzer, output, files)
+            if analyzer_pool is not None:
+                _analyze_parallel(analyzer_pool, output, files, batch_sizer, unordered)
+            elif parallel_level == 1:
+                _analyze_single(analyzer, output, files, batch_sizer, unordered)
             else:
-                _analyze_parallel(analyzer, output, files, parallel_level)
+                with AnalyzerPool(analyzer, parallel_level, share_model, result_transport) as analyzer_pool:
+                    _analyze_parallel(analyzer_pool, output, files, batch_sizer, unordered)
     finally:
         output.close()
 
+    if profile and analyzer.profiler:
+        analyzer.profiler.write_report(time.perf_counter() - start, profile)
+
 
 def _analyze_tty(analyzer: Analyzer, output: _OutputWrapper) -> None:
     try:
@@ -151,146 +248,89 @@ def _analyze_tty(analyzer: Analyzer, output: _OutputWrapper) -> None:
         pass
 
 
-def _analyze_single(analyzer: Analyzer, output: _OutputWrapper, files: Iterable[str]) -> None:
+def _analyze_single(
+    analyzer: Analyzer,
+    output: _OutputWrapper,
+    files: Iterable[str],
+    batch_sizer: MiniBatchSizer,
+    unordered: bool = False,
+) -> None:
     try:
         analyzer.set_nlp()
-        batch = []
-        for path in files:
-            with open(path, "r", encoding="utf-8") as f:
-                for line in f:
-                    batch.append(line)
-                    if len(batch) < MINI_BATCH_SIZE:
-                        continue
-                    output.write(analyzer.analyze_batch(batch))
-                    batch.clear()
-        if batch:
-            output.write(analyzer.analyze_batch(batch))
+        offsets = []
+        for i, mini_batch in enumerate(_data_loader(files, batch_sizer, offsets)):
+            start = time.perf_counter()
+            result = analyzer.analyze_batch(mini_batch)
+            batch_sizer.update(sum(len(line) for line in mini_batch), time.perf_counter() - start)
+            if unordered:
+                output.write(_input_offset_line(offsets[i]))
+            output.write(result)
     except KeyboardInterrupt:
         pass
 
 
-def _analyze_parallel(analyzer: Analyzer, output: _OutputWrapper, files: Iterable[str], parallel_level: int) -> None:
+def _analyze_parallel(
+    analyzer_pool: AnalyzerPool,
+    output: _OutputWrapper,
+    files: Iterable[str],
+    batch_sizer: MiniBatchSizer,
+    unordered: bool = False,
+) -> None:
     try:
-        in_queue = Queue(maxsize=parallel_level * 2)
-        out_queue = Queue()
-
-        p_analyzes = []
-        abort = Event()
-        for _ in range(parallel_level):
-            p = Process(target=_multi_process_analyze, args=(analyzer, in_queue, out_queue, abort), daemon=True)
-            p.start()
-            p_analyzes.append(p)
+        if unordered:
+            offsets = []
+            batches = _data_loader(files, batch_sizer, offsets)
+            for i, result in analyzer_pool.analyze_batches_unordered(batches, batch_sizer):
+                output.write(_input_offset_line(offsets[i]))
+                output.write(result)
+        else:
+            for result in analyzer_pool.analyze_batches(_data_loader(files, batch_sizer), batch_sizer):
+                output.write(result)
+    except KeyboardInterrupt:
+        pass
 
-        p_load = Process(target=_multi_process_load, args=(in_queue, files, MINI_BATCH_SIZE, parallel_level, abort), daemon=True)
-        p_load.start()
 
-        _main_process_write(out_queue, output, parallel_level, abort)
+def _input_offset_line(offset: int) -> str:
+    return f"# input_offset = {offset}\n"
 
-    except KeyboardInterrupt:
-        abort.set()
-    finally:
-        for p in [p_load] + p_analyzes:
-            try:
-                p.join(timeout=1)
-            except:
-                if p.is_alive():
-                    p.terminate()
-                    p.join()
 
+def _data_loader(files: List[str], batch_sizer: MiniBatchSizer, offsets: Optional[List[int]] = None) -> Generator[List[str], None, None]:
+    """Yields the mini-batches of the input lines.
 
-def _data_loader(files: List[str], batch_size: int) -> Generator[List[str], None, None]:
+    If offsets is given, the line offset of the first line of each mini-batch is appended to it before yielding the mini-batch.
+    """
     mini_batch = []
+    n_chars = 0
+    n_lines = 0
     for path in files:
         with open(path, "r", encoding="utf-8") as f:
             for line in f:
                 mini_batch.append(line)
-                if len(mini_batch) == batch_size:
+                n_chars += len(line)
+                if batch_sizer.is_full(len(mini_batch), n_chars):
+                    if offsets is not None:
+                        offsets.append(n_lines)
                     yield mini_batch
+                    n_lines += len(mini_batch)
                     mini_batch = []
+                    n_chars = 0
     if mini_batch:
+        if offsets is not None:
+            offsets.append(n_lines)
         yield mini_batch
 
 
-def _multi_process_load(in_queue: Queue, files: List[str], batch_size: int, n_analyze_process: int, abort: Event):
-    try:
-        for i, mini_batch in enumerate(_data_loader(files, batch_size)):
-            if abort.is_set():
-                break
-            in_queue.put((i, mini_batch))
-        else:
-            for _ in range(n_analyze_process):
-                in_queue.put("terminate")
-    except KeyboardInterrupt:
-        pass
-    except:
-        traceback.print_exc()
-        abort.set()
-
-
-def _multi_process_analyze(analyzer: Analyzer, in_queue: Queue, out_queue: Queue, abort: Event):
-    i = None
-    mini_batch = []
-    try:
-        while True:
-            if abort.is_set():
-                break
-            try:
-                msg = in_queue.get(timeout=0.1)
-            except queue.Empty:
-                continue
-            if msg == "terminate":
-                out_queue.put(("terminating", i, None))
-                break
-            i, mini_batch = msg
-            result = analyzer.analyze_batch(mini_batch)
-            out_queue.put((None, i, result))
-    except KeyboardInterrupt:
-        pass
-    except Exception as err:
-        out_queue.put(("Error: {}\n{}".format(err, "".join(mini_batch)), i, None))
-        traceback.print_exc()
-        abort.set()
-
-
-def _main_process_write(out_queue: queue, output: _OutputWrapper, parallel_level: int, abort: Event):
-    cur = 0
-    results = dict()
-    terminating = 0
-    while True:
-        if abort.is_set():
-            return
-        try:
-            msg, mini_batch_index, result = out_queue.get(timeout=0.1)
-        except queue.Empty:
-            continue
-
-        if msg is not None:
-            if msg == "terminating":
-                terminating += 1
-                if terminating == parallel_level:
-                    return
-                continue
-            else:
-                print(f"Analysis failed in mini_batch #{mini_batch_index}. Stopping all the processes.", file=sys.stderr)
-                print(msg, file=sys.stderr)
-                return
-
-        # output must be ordered same as input text
-        results[mini_batch_index] = result
-        while results:
-            if cur not in results.keys():
-                break
-            result = results[cur]
-            del results[cur]
-            cur += 1
-            output.write(result)
-
-
 @plac.annotations(
     split_mode=("split mode", "option", "s", str, ["A", "B", "C"]),
     hash_comment=("hash comment", "option", "c", str, ["print", "skip", "analyze"]),
     output_path=("output path", "option", "o", Path),
     parallel=("parallel level (default=-1, all_cpus=0)", "option", "p", int),
+    batch_chars=("mini-batch size in characters (default=0, batch by lines)", "option", "B", int),
+    batch_latency=("target seconds per mini-batch to adapt the character budget (default=0, fixed)", "option", "L", float),
+    result_transport=("result transport from the analyze processes", "option", "T", str, RESULT_TRANSPORTS),
+    unordered=("write each mini-batch as soon as analyzed, tagged with its input line offset", "flag", "u"),
+    profile=("write the time of the components, formatters and queue waits to stderr (-) or a JSON file", "option", "P", str),
+    threads=("number of tokenizer threads sharing the dictionary in each process (default=1)", "option", "t", int),
     files=("input files", "positional"),
 )
 def run_ginzame(
@@ -298,6 +338,12 @@ def run_ginzame(
     hash_comment="print",
     output_path=None,
     parallel=-1,
+    batch_chars=0,
+    batch_latency=0.0,
+    result_transport="queue",
+    unordered=False,
+    profile=None,
+    threads=1,
     *files,
 ):
     run(
@@ -312,6 +358,12 @@ def run_ginzame(
         parallel_level=parallel,
         disable_sentencizer=False,
         files=files,
+        batch_chars=batch_chars,
+        batch_latency=batch_latency,
+        result_transport=result_transport,
+        unordered=unordered,
+        profile=profile,
+        threads=threads,
     )
 
 
@@ -325,11 +377,17 @@ def main_ginzame():
     split_mode=("split mode", "option", "s", str, ["A", "B", "C"]),
     hash_comment=("hash comment", "option", "c", str, ["print", "skip", "analyze"]),
     output_path=("output path", "option", "o", Path),
-    output_format=("output format", "option", "f", str, ["0", "conllu", "1", "cabocha", "2", "mecab", "3", "json"]),
+    output_format=("output format", "option", "f", str, ["0", "conllu", "1", "cabocha", "2", "mecab", "3", "json", "4", "jsonl", "5", "docbin"]),
     require_gpu=("enable require_gpu", "option", "g", int),
     use_normalized_form=("Use Token.norm_ instead of Token.lemma_", "flag", "n"),
     disable_sentencizer=("disable spaCy's sentence separator", "flag", "d"),
     parallel=("parallel level (default=1, all_cpus=0)", "option", "p", int),
+    share_model=("load the model once and share it with the forked analyze processes", "flag", "S"),
+    batch_chars=("mini-batch size in characters (default=0, batch by lines)", "option", "B", int),
+    batch_latency=("target seconds per mini-batch to adapt the character budget (default=0, fixed)", "option", "L", float),
+    result_transport=("result transport from the analyze processes", "option", "T", str, RESULT_TRANSPORTS),
+    unordered=("write each mini-batch as soon as analyzed, tagged with its input line offset", "flag", "u"),
+    profile=("write the time of the components, formatters and queue waits to stderr (-) or a JSON file", "option", "P", str),
     files=("input files", "positional"),
 )
 def run_ginza(
@@ -343,6 +401,12 @@ def run_ginza(
     use_normalized_form=False,
     disable_sentencizer=False,
     parallel=1,
+    share_model=False,
+    batch_chars=0,
+    batch_latency=0.0,
+    result_transport="queue",
+    unordered=False,
+    profile=None,
     *files,
 ):
     run(
@@ -357,11 +421,74 @@ def run_ginza(
         disable_sentencizer=disable_sentencizer,
         parallel_level=parallel,
         files=files,
+        share_model=share_model,
+        batch_chars=batch_chars,
+        batch_latency=batch_latency,
+        result_transport=result_transport,
+        unordered=unordered,
+        profile=profile,
     )
 
 
 def main_ginza():
-    plac.call(run_ginza)
+    if len(sys.argv) > 1 and sys.argv[1] == "render":
+        plac.call(run_render, sys.argv[2:])
+    else:
+        plac.call(run_ginza)
+
+
+def render(
+    output_path: Optional[Path] = None,
+    output_format: str = "conllu",
+    use_normalized_form: bool = False,
+    files: List[str] = None,
+):
+    """Writes the Docs stored in the DocBin shards in output_format without loading any model.
+
+    Each of the files can be a shard or a directory of the shards, which are read in the order of their names.
+    """
+    from spacy.tokens import DocBin
+    from spacy.vocab import Vocab
+
+    assert output_format not in ["2", "mecab", "5", "docbin"], f"{output_format} not supported by render."
+
+    shards = []
+    for path in files:
+        path = Path(path)
+        if path.is_dir():
+            shards += sorted(path.glob(f"*{DOCBIN_SHARD_SUFFIX}"))
+        else:
+            shards.append(path)
+
+    vocab = Vocab()
+    output = _OutputWrapper(output_path, output_format)
+    output.open()
+    try:
+        for shard in shards:
+            docs = DocBin().from_disk(shard).get_docs(vocab)
+            output.write(format_docs(docs, output_format, use_normalized_form, True))
+    finally:
+        output.close()
+
+
+@plac.annotations(
+    output_path=("output path", "option", "o", Path),
+    output_format=("output format", "option", "f", str, ["0", "conllu", "1", "cabocha", "3", "json", "4", "jsonl"]),
+    use_normalized_form=("Use Token.norm_ instead of Token.lemma_", "flag", "n"),
+    files=("DocBin shard files or directories", "positional"),
+)
+def run_render(
+    output_path=None,
+    output_format="conllu",
+    use_normalized_form=False,
+    *files,
+):
+    render(
+        output_path=output_path,
+        output_format=output_format,
+        use_normalized_form=use_normalized_form,
+        files=files,
+    )
 
 
 if __name__ == "__main__":
@@ -1,12 +1,18 @@
 # encoding: utf8
 from collections import OrderedDict
+from functools import lru_cache
 import re
+import sys
+from typing import Dict, List, Optional
 
+import numpy
 import srsly
+from thinc.api import get_array_module
 
 from spacy import util
+from spacy.attrs import DEP, HEAD
 from spacy.language import Language
-from spacy.lang.ja import resolve_pos
+from spacy.lang.ja import DetailedToken, resolve_pos
 from spacy.tokens import Doc, MorphAnalysis
 
 __all__ = [
@@ -15,6 +21,9 @@ __all__ = [
 ]
 
 
+POS_CACHE_SIZE = 8192
+MORPH_CACHE_SIZE = 8192
+
 TAG_DEP_MAP = {
     "ADJ": "amod",
     "ADP": "case",
@@ -28,6 +37,12 @@ def tag_dep_map(tag):
     return TAG_DEP_MAP.get(tag, "compound")
 
 
+@lru_cache(maxsize=POS_CACHE_SIZE)
+def _resolve_pos(surface, tag, next_tag):
+    # the combinations of the sub-token surfaces and the tags repeat heavily over a corpus
+    return resolve_pos(surface, tag, next_tag)
+
+
 def tag_to_pos(sub_tokens, next_token_tag):
     pos_list = []
     next_pos = None
@@ -36,16 +51,30 @@ def tag_to_pos(sub_tokens, next_token_tag):
             pos = next_pos
             next_pos = None
         else:
-            pos, next_pos = resolve_pos(t1.surface, t1.tag, t2.tag)
+            pos, next_pos = _resolve_pos(t1.surface, t1.tag, t2.tag)
         pos_list.append(pos)
     if next_pos:
         pos = next_pos
     else:
-        pos, next_pos = resolve_pos(sub_tokens[-1].surface, sub_tokens[-1].tag, next_token_tag)
+        pos, next_pos = _resolve_pos(sub_tokens[-1].surface, sub_tokens[-1].tag, next_token_tag)
     pos_list.append(pos)
     return pos_list
 
 
+def morph(dtoken: DetailedToken) -> str:
+    return _morph(dtoken.inf, dtoken.reading)
+
+
+@lru_cache(maxsize=MORPH_CACHE_SIZE)
+def _morph(inf: str, reading: str) -> str:
+    m = {}
+    if inf:
+        m["Inflection"] = inf
+    if reading:
+        m["Reading"] = re.sub("[=|]", "_", reading)
+    return "|".join(f"{k}={v}" for k, v in m.items())
+
+
 def _replace_list_entries(lst, index, inserting_list):
     return lst[:index] + inserting_list + lst[index + 1:]
 
@@ -54,6 +83,9 @@ class CompoundSplitter:
     def __init__(self, vocab, split_mode=None):
         self.vocab = vocab
         self.split_mode = split_mode
+        # the numbers of the tokens split and left as they are, accumulated for monitoring
+        self.split_tokens = 0
+        self.skipped_tokens = 0
 
     def __call__(self, doc: Doc):
         if "sub_tokens" not in doc.user_data:
@@ -61,6 +93,7 @@ class CompoundSplitter:
         if self._split_mode is None:
             return doc
         elif self._split_mode == "C":
+            self.skipped_tokens += len(doc)
             del doc.user_data["sub_tokens"]
             return doc
         elif self._split_mode == "B":
@@ -70,72 +103,153 @@ class CompoundSplitter:
         else:
             raise Exception("invalid split_mode: " + self._split_mode)
 
-        sub_tokens_list = [
-            sub_tokens[sub_tokens_index] if sub_tokens else None for sub_tokens in doc.user_data["sub_tokens"]
+        # the tokens which have two or more sub-tokens in the split mode
+        split_indices = [
+            i for i, sub_tokens in enumerate(doc.user_data["sub_tokens"]) if sub_tokens and len(sub_tokens[sub_tokens_index]) > 1
         ]
+        self.split_tokens += len(split_indices)
+        self.skipped_tokens += len(doc) - len(split_indices)
+        if split_indices:
+            sub_tokens_list = [None] * len(doc)
+            for i in split_indices:
+                sub_tokens_list[i] = doc.user_data["sub_tokens"][i][sub_tokens_index]
+            self._split(doc, sub_tokens_list)
+
+        del doc.user_data["sub_tokens"]
+        return doc
+
+    def _split(self, doc: Doc, sub_tokens_list: List[Optional[List[DetailedToken]]]):
+        """Splits all the tokens in a single retokenization and then sets the heads at once.
 
-        for token_i, sub_tokens in reversed(tuple(zip(range(len(doc)), sub_tokens_list))):
-            token = doc[token_i]
-            token_ent_type = token.ent_type
+        The heads are assigned as if the tokens were split one by one from the end of the doc:
+        the dependents of a split token are attached to its last sub-token (the first one for compounds),
+        and the sub-tokens are attached to the last sub-token or to the head of the original token.
+        """
+        length = len(doc)
+        array = doc.to_array([HEAD, DEP])
+        heads = (numpy.arange(length, dtype="int64") + array[:, 0].astype("int64")).tolist()
+        strings = doc.vocab.strings
+        deps = [strings[dep] for dep in array[:, 1].tolist()]
+        tags = [token.tag_ for token in doc]
+        compounds = [heads[i] != i and deps[i] in {"compound", "nummod", "punct"} for i in range(length)]
 
-            # edit token.dep_
-            if token.head.i == token.i:
-                dep = "ROOT"
+        # the index of the first sub-token of each token after the split, and the token to attach its dependents
+        new_starts = [0] * (length + 1)
+        anchors = [0] * length
+        for i, sub_tokens in enumerate(sub_tokens_list):
+            n = len(sub_tokens) if sub_tokens else 1
+            new_starts[i + 1] = new_starts[i] + n
+            anchors[i] = new_starts[i] if compounds[i] else new_starts[i] + n - 1
+
+        # the retokenizer reallocates the tensor for each split, so it is rebuilt once after all the splits
+        tensor = doc.tensor
+        if tensor is not None and tensor.size != 0:
+            doc.tensor = tensor[:0]
+        else:
+            tensor = None
+
+        try:
+            with doc.retokenize() as retokenizer:
+                for token_i, sub_tokens in enumerate(sub_tokens_list):
+                    if not sub_tokens:
+                        continue
+                    token = doc[token_i]
+                    last = len(sub_tokens) - 1
+                    if heads[token_i] == token_i:
+                        split_heads = [(token, last) for _ in range(last + 1)]
+                    elif compounds[token_i]:
+                        split_heads = [token.head for _ in range(len(sub_tokens))]
+                    else:
+                        split_heads = [(token, last) for _ in range(last)] + [token.head]
+                    if token_i < length - 1:
+                        # the next token has already been split when splitting one by one from the end
+                        next_token_tag = sub_tokens_list[token_i + 1][0].tag if sub_tokens_list[token_i + 1] else tags[token_i + 1]
+                    else:
+                        next_token_tag = None
+                    attrs = {
+                        "TAG": [dtoken.tag for dtoken in sub_tokens],
+                        "DEP": [tag_dep_map(dtoken.tag) for dtoken in sub_tokens[:-1]] + [deps[token_i]],
+                        "POS": tag_to_pos(sub_tokens, next_token_tag),
+                        "LEMMA": [dtoken.lemma for dtoken in sub_tokens],
+                        "NORM": [dtoken.norm for dtoken in sub_tokens],
+                        "ENT_TYPE": [token.ent_type for dtoken in sub_tokens],
+                        "MORPH": [morph(dtoken) for dtoken in sub_tokens],
+                    }
+                    retokenizer.split(token, [dtoken.surface for dtoken in sub_tokens], heads=split_heads, attrs=attrs)
+        except Exception as e:
+            if tensor is not None:
+                doc.tensor = tensor
+            print("Retokenization error:", file=sys.stderr)
+            print(doc.text, file=sys.stderr)
+            print([(t.i, t.orth_) for t in doc], file=sys.stderr)
+            print(list(enumerate(doc.user_data["sub_tokens"])), file=sys.stderr)
+            raise e
+
+        if tensor is not None:
+            # the rows of the split tokens are filled with zeros as the retokenizer does, but no surplus rows are appended
+            xp = get_array_module(tensor)
+            kept = [i for i, sub_tokens in enumerate(sub_tokens_list) if not sub_tokens]
+            new_tensor = xp.zeros((new_starts[length], tensor.shape[1]), dtype="float32")
+            new_tensor[xp.asarray([new_starts[i] for i in kept], dtype="int64")] = tensor[xp.asarray(kept, dtype="int64")]
+            doc.tensor = new_tensor
+
+        new_heads = [0] * new_starts[length]
+        for i, sub_tokens in enumerate(sub_tokens_list):
+            start = new_starts[i]
+            last = new_starts[i + 1] - 1
+            head = heads[i]
+            if head == i:
+                new_heads[start:last + 1] = [last] * (last + 1 - start)
+            elif compounds[i]:
+                new_heads[start:last + 1] = [anchors[head]] * (last + 1 - start)
             else:
-                dep = token.dep_
-
-            compounds = dep in {"compound", "nummod", "punct"}
-
-            # retokenize
-            if sub_tokens_index is not None and sub_tokens:
-                deps = [tag_dep_map(dtoken.tag) for dtoken in sub_tokens[:-1]] + [token.dep_]
-                last = len(sub_tokens) - 1
-                if token.head.i == token.i:
-                    heads = [(token, last) for _ in range(last + 1)]
-                elif compounds:
-                    heads = [token.head for _ in range(len(sub_tokens))]
-                else:
-                    heads = [(token, last) for _ in range(last)] + [token.head]
-                surfaces = [dtoken.surface for dtoken in sub_tokens]
-                def morph(dtoken):
-                    m = {}
-                    if dtoken.inf:
-                        m["Inflection"] = dtoken.inf
-                    if dtoken.reading:
-                        m["Reading"] = re.sub("[=|]", "_", dtoken.reading)
-                    return "|".join(f"{k}={v}" for k, v in m.items())
-                attrs = {
-                    "TAG": [dtoken.tag for dtoken in sub_tokens],
-                    "DEP": deps,
-                    "POS": tag_to_pos(
-                        sub_tokens,
-                        doc[token.i + 1].tag_ if token.i < len(doc) - 1 else None
-                    ),
-                    "LEMMA": [dtoken.lemma for dtoken in sub_tokens],
-                    "NORM": [dtoken.norm for dtoken in sub_tokens],
-                    "ENT_TYPE": [token_ent_type for dtoken in sub_tokens],
-                    "MORPH": [morph(dtoken) for dtoken in sub_tokens],
-                }
-                try:
-                    with doc.retokenize() as retokenizer:
-                        retokenizer.split(token, surfaces, heads=heads, attrs=attrs)
-                except Exception as e:
-                    import sys
-                    print("Retokenization error:", file=sys.stderr)
-                    print(doc.text, file=sys.stderr)
-                    print([(t.i, t.orth_) for t in doc], file=sys.stderr)
-                    print(list(enumerate(doc.user_data["sub_tokens"])), file=sys.stderr)
-                    raise e
-
-                # work-around: retokenize() does not consider the head of the splitted tokens
-                if not compounds:
-                    for t in doc:
-                        if t.i < token_i or token_i + len(sub_tokens) <= t.i:
-                            if t.head.i == token_i:
-                                t.head = doc[token_i + last]
+                new_heads[start:last] = [last] * (last - start)
+                new_heads[last] = anchors[head]
 
-        del doc.user_data["sub_tokens"]
-        return doc
+        # Splitting token by token, the dependents of each split token were moved with Token.head, which updates
+        # the edges only around the moved tokens. Only the moves for the first split token survive the following
+        # retokenizations, so they are replayed to keep the same parse properties.
+        first = next(i for i, sub_tokens in enumerate(sub_tokens_list) if sub_tokens)
+        moved = []
+        if not compounds[first]:
+            first_start = new_starts[first]
+            first_last = new_starts[first + 1] - 1
+            moved = [
+                i for i, head in enumerate(new_heads) if head == first_last and not first_start <= i <= first_last
+            ]
+            for i in moved:
+                new_heads[i] = first_start
+
+        array = doc.to_array([HEAD, DEP])
+        array[:, 0] = (numpy.array(new_heads, dtype="int64") - numpy.arange(len(new_heads), dtype="int64")).astype("uint64")
+        doc.from_array([HEAD, DEP], array)
+        for i in moved:
+            doc[i].head = doc[first_last]
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the counters for monitoring: the split and skipped tokens of this instance,
+        and the hits and misses of the caches shared in the process."""
+        resolve_pos_info = _resolve_pos.cache_info()
+        morph_info = _morph.cache_info()
+        return {
+            "split_tokens": self.split_tokens,
+            "skipped_tokens": self.skipped_tokens,
+            "resolve_pos_hits": resolve_pos_info.hits,
+            "resolve_pos_misses": resolve_pos_info.misses,
+            "morph_hits": morph_info.hits,
+            "morph_misses": morph_info.misses,
+        }
+
+    @staticmethod
+    def cache_info() -> Dict[str, Dict[str, int]]:
+        """Returns the hits, the misses and the current size of the POS resolution and the morph caches.
+
+        The caches are shared by all the instances in the process.
+        """
+        return {
+            name: {"hits": info.hits, "misses": info.misses, "size": info.currsize, "maxsize": info.maxsize}
+            for name, info in (("resolve_pos", _resolve_pos.cache_info()), ("morph", _morph.cache_info()))
+        }
 
     @property
     def split_mode(self) -> str:
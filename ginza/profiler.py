@@ -0,0 +1,109 @@
+# coding: utf8
+from contextlib import contextmanager
+import json
+import sys
+import time
+from typing import Dict, Optional
+
+__all__ = [
+    "Profiler",
+]
+
+
+class Profiler:
+    """Accumulates the wall and CPU time of the pipeline components, the formatters and the queue waits.
+
+    The records of the analyze processes are taken out with `pop()` and merged into the profiler
+    of the main process with `merge()`, so the times in the report are summed over the processes.
+    """
+
+    GROUPS = ("components", "formatters", "waits")
+
+    def __init__(self) -> None:
+        self.records = {group: {} for group in self.GROUPS}
+        self.counts = {"lines": 0, "docs": 0, "sentences": 0, "tokens": 0}
+
+    @contextmanager
+    def measure(self, name: str, group: str = "components"):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - wall, time.process_time() - cpu, group)
+
+    def add(self, name: str, wall: float, cpu: float = 0.0, group: str = "components", calls: int = 1) -> None:
+        record = self.records[group].get(name)
+        if record is None:
+            self.records[group][name] = [wall, cpu, calls]
+        else:
+            record[0] += wall
+            record[1] += cpu
+            record[2] += calls
+
+    def wait(self, name: str, seconds: float) -> None:
+        self.add(name, seconds, 0.0, "waits")
+
+    def count(self, **counts: int) -> None:
+        for k, v in counts.items():
+            self.counts[k] = self.counts.get(k, 0) + v
+
+    def pop(self) -> Dict:
+        """Returns the records and the counts accumulated so far, and resets them."""
+        data = {"records": self.records, "counts": self.counts}
+        self.__init__()
+        return data
+
+    def merge(self, data: Dict) -> None:
+        for group, records in data["records"].items():
+            for name, (wall, cpu, calls) in records.items():
+                self.add(name, wall, cpu, group, calls)
+        self.count(**data["counts"])
+
+    def report(self, elapsed: float) -> Dict:
+        result = {"elapsed": elapsed}
+        result.update(self.counts)
+        result["sentences_per_sec"] = self.counts["sentences"] / elapsed if elapsed > 0 else 0.0
+        result["tokens_per_sec"] = self.counts["tokens"] / elapsed if elapsed > 0 else 0.0
+        for group in self.GROUPS:
+            result[group] = {
+                name: {"wall": wall, "cpu": cpu, "calls": calls} for name, (wall, cpu, calls) in self.records[group].items()
+            }
+        return result
+
+    def write_report(self, elapsed: float, path: Optional[str] = None) -> None:
+        """Writes the report to stderr in text, or to the path in JSON."""
+        result = self.report(elapsed)
+        if path and path != "-":
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False, indent=1)
+            return
+        print(
+            "profile: {:.3f} sec, {} lines, {} sentences ({:.1f} sents/sec), {} tokens ({:.1f} tokens/sec)".format(
+                elapsed,
+                result["lines"],
+                result["sentences"],
+                result["sentences_per_sec"],
+                result["tokens"],
+                result["tokens_per_sec"],
+            ),
+            file=sys.stderr,
+        )
+        if "split_tokens" in result:
+            print(
+                "compound_splitter: {} tokens split, {} tokens skipped, resolve_pos cache {} hits / {} misses, morph cache {} hits / {} misses".format(
+                    result["split_tokens"],
+                    result["skipped_tokens"],
+                    result["resolve_pos_hits"],
+                    result["resolve_pos_misses"],
+                    result["morph_hits"],
+                    result["morph_misses"],
+                ),
+                file=sys.stderr,
+            )
+        for group in self.GROUPS:
+            if not result[group]:
+                continue
+            print(f"{group + ':':<40}{'wall(sec)':>12}{'cpu(sec)':>12}{'calls':>10}", file=sys.stderr)
+            for name, record in result[group].items():
+                print(f"  {name:<38}{record['wall']:>12.3f}{record['cpu']:>12.3f}{record['calls']:>10}", file=sys.stderr)
@@ -2,7 +2,7 @@
 import json
 import pytest
 
-from ginza.analyzer import Analyzer
+from ginza.analyzer import Analyzer, format_cabocha, format_cabocha_doc, format_conllu, format_conllu_doc, format_mecab
 
 
 TOKEN_TESTS = [
@@ -78,6 +78,10 @@ def _tokens_json(result: str):
                     ret.append(t["orth"])
     return ret
 
+def _tokens_jsonl(result: str):
+    return _tokens_json(",".join(result.rstrip("\n").split("\n")))
+
+
 class TestAnalyzer:
     def test_model_name_or_path_ja_ginza(self, mocker, analyzer):
         spacy_load_mock = mocker.patch("spacy.load")
@@ -104,6 +108,7 @@ class TestAnalyzer:
             ("conllu", TypeError, _tokens_conllu),
             ("cabocha", TypeError, _tokens_cabocha),
             ("json", TypeError, _tokens_json),
+            ("jsonl", TypeError, _tokens_jsonl),
         ],
     )
     def test_analyze_line(self, output_format, raises_analysis_before_set, input_text, tokens, tokens_func, analyzer):
@@ -131,6 +136,21 @@ class TestAnalyzer:
         ret = analyzer.analyze_line(input_text)
         assert tokens_func(ret) == tokens
 
+    @pytest.mark.parametrize("use_normalized_form", [False, True])
+    @pytest.mark.parametrize("threads", [1, 2])
+    def test_analyze_batch_mecab(self, threads, use_normalized_form, analyzer):
+        analyzer.output_format = "mecab"
+        analyzer.threads = threads
+        analyzer.use_normalized_form = use_normalized_form
+        analyzer.set_nlp()
+        lines = ["# comment\n", "\n"] + [line + "\n" for line in BATCH_TESTS[0][0] + MECAB_TESTS[0][:1]]
+        expected = "".join(
+            line if line.startswith("#") else "\n" if line == "\n" else format_mecab(analyzer.nlp.tokenize(line.rstrip("\n")), use_normalized_form)
+            for line in lines
+        )
+        assert analyzer.analyze_batch(lines) == expected
+        assert analyzer.pos_cache
+
     @pytest.mark.parametrize("input_batch, tokens_batch", BATCH_TESTS)
     @pytest.mark.parametrize(
         "output_format, tokens_func",
@@ -138,6 +158,7 @@ class TestAnalyzer:
             ("conllu", _tokens_conllu),
             ("cabocha", _tokens_cabocha),
             ("json", _tokens_json),
+            ("jsonl", _tokens_jsonl),
         ],
     )
     def test_analyze_batch(self, output_format, input_batch, tokens_batch, tokens_func, analyzer):
@@ -145,6 +166,35 @@ class TestAnalyzer:
         ret = analyzer.analyze_batch(input_batch)
         assert tokens_func(ret) == sum(tokens_batch, [])
 
+    @pytest.mark.parametrize("output_format", ["json", "jsonl"])
+    def test_analyze_json_escape(self, output_format, analyzer):
+        analyzer.output_format = output_format
+        analyzer.set_nlp()
+        ret = analyzer.analyze_line('彼は"引用符"と\\記号を書いた。')
+        data = json.loads(f"[{ret}]")
+        assert data[0]["paragraphs"][0]["raw"] == '彼は"引用符"と\\記号を書いた。'
+        assert '"' in [t["orth"] for t in data[0]["paragraphs"][0]["sentences"][0]["tokens"]]
+
+    @pytest.mark.parametrize("use_normalized_form", [False, True])
+    @pytest.mark.parametrize("split_mode", ["A", "C"])
+    def test_format_conllu_doc(self, split_mode, use_normalized_form, analyzer):
+        analyzer.split_mode = split_mode
+        analyzer.set_nlp()
+        for text in BATCH_TESTS[0][0] + ['彼は"a|b\\c"と書いた。東京都選挙管理委員会に行く。']:
+            doc = analyzer.nlp(text)
+            expected = "".join(format_conllu(sent, use_normalized_form, True) for sent in doc.sents)
+            assert format_conllu_doc(doc, use_normalized_form, True) == expected
+
+    @pytest.mark.parametrize("use_normalized_form", [False, True])
+    @pytest.mark.parametrize("split_mode", ["A", "C"])
+    def test_format_cabocha_doc(self, split_mode, use_normalized_form, analyzer):
+        analyzer.split_mode = split_mode
+        analyzer.set_nlp()
+        for text in BATCH_TESTS[0][0] + ['彼は"a|b\\c"と書いた。東京都選挙管理委員会に行く。']:
+            doc = analyzer.nlp(text)
+            expected = "".join(format_cabocha(sent, use_normalized_form) for sent in doc.sents)
+            assert format_cabocha_doc(doc, use_normalized_form) == expected
+
     @pytest.mark.parametrize(
         "raises_analysis_before_set, tokens_func",
         [
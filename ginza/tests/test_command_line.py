@@ -9,6 +9,8 @@ import pytest
 
 import torch
 import ginza.command_line as cli
+from ginza import AnalyzerPool
+from ginza.analyzer import Analyzer
 
 TEST_TEXT = "#コメント\n今日はかつ丼を食べた。\n明日は東京で蕎麦を食べる。明後日は酒が飲みたい。"
 
@@ -63,6 +65,11 @@ def _conllu_parsable(result: str):
             raise Exception
 
 
+def _jsonl_parsable(result: str):
+    for line in result.split("\n"):
+        _json_parsable(f"[{line}]")
+
+
 def _cabocha_parsable(result: str):
     for line in result.split("\n"):
         if line.strip() in ("", "EOS") or line.startswith("*") or line.startswith("#"):
@@ -204,6 +211,7 @@ class TestCLIGinza:
             ("cabocha", _cabocha_parsable),
             ("mecab", _mecab_parsable),
             ("json", _json_parsable),
+            ("jsonl", _jsonl_parsable),
         ],
     )
     def test_output_format(self, output_format, result_parsable, input_file):
@@ -211,6 +219,13 @@ class TestCLIGinza:
         assert p.returncode == 0
         result_parsable(p.stdout.strip())
 
+    def test_jsonl_one_line_per_input(self, input_file):
+        p = run_cmd(["ginza", "-f", "jsonl", input_file], stderr=sp.PIPE)
+        assert p.returncode == 0
+        assert 'hash_comment="print" not permitted for JSON Lines output' in p.stderr
+        lines = p.stdout.split("\n")[:-1]
+        assert [json.loads(line)["paragraphs"][0]["raw"] for line in lines] == TEST_TEXT.split("\n")
+
     @pytest.mark.parametrize(
         "hash_comment", ["print", "skip"]
     )
@@ -254,6 +269,51 @@ class TestCLIGinza:
         p = run_cmd(["ginza", "-p", "2", input_file])
         assert p.returncode == 0
 
+    def test_parallel_share_model(self, input_file):
+        p_single = run_cmd(["ginza", input_file])
+        p = run_cmd(["ginza", "-p", "2", "-S", input_file], stderr=sp.PIPE)
+        assert p.returncode == 0
+        assert p.stdout == p_single.stdout
+        assert "analyze process #1" in p.stderr
+
+    @pytest.mark.parametrize("parallel", ["1", "2"])
+    def test_profile(self, parallel, input_file, tmpdir):
+        profile_path = tmpdir / f"profile_{parallel}.json"
+        p = run_cmd(["ginza", "-p", parallel, "-P", profile_path, input_file])
+        assert p.returncode == 0
+        with open(profile_path, "r") as f:
+            profile = json.load(f)
+        assert profile["lines"] == len(TEST_TEXT.split("\n"))
+        assert profile["sentences"] == 3
+        assert profile["tokens"] > 0 and profile["tokens_per_sec"] > 0
+        assert {"tokenizer", "parser", "compound_splitter", "bunsetu_recognizer"} <= set(profile["components"])
+        assert list(profile["formatters"]) == ["format_conllu"]
+        if parallel == "2":
+            assert any(name.startswith("worker#") for name in profile["waits"])
+        assert profile["split_tokens"] == 0 and profile["skipped_tokens"] == profile["tokens"]
+
+    def test_profile_stderr(self, input_file):
+        p = run_cmd(["ginza", "-P", "-", input_file], stderr=sp.PIPE)
+        assert p.returncode == 0
+        assert "sents/sec" in p.stderr and "bunsetu_recognizer" in p.stderr
+        assert p.stdout == run_cmd(["ginza", input_file]).stdout
+
+
+class TestCLIGinzaRender:
+    def test_render(self, input_file, tmpdir):
+        shard_dir = tmpdir / "shards"
+        p = run_cmd(["ginza", "-f", "docbin", "-o", shard_dir, input_file], stderr=sp.PIPE)
+        assert p.returncode == 0
+        assert 'hash_comment="print" not permitted for DocBin output' in p.stderr
+        p_render = run_cmd(["ginza", "render", "-f", "conllu", shard_dir])
+        assert p_render.returncode == 0
+        p_direct = run_cmd(["ginza", "-c", "analyze", input_file])
+        assert p_render.stdout == p_direct.stdout
+
+    def test_docbin_requires_output_path(self, input_file):
+        p = run_cmd(["ginza", "-f", "docbin", input_file], stderr=sp.PIPE)
+        assert p.returncode != 0
+
 
 class TestCLIGinzame:
     def test_ginzame(self, input_file):
@@ -263,6 +323,40 @@ class TestCLIGinzame:
         assert p_ginzame.returncode == 0
         assert p_ginzame.stdout == p_ginza.stdout
 
+    @pytest.mark.parametrize("hash_comment", ["print", "skip"])
+    def test_ginzame_threads(self, hash_comment, input_file):
+        p_single = run_cmd(["ginzame", "-p", "1", "-c", hash_comment, input_file])
+        p_threads = run_cmd(["ginzame", "-p", "1", "-t", "3", "-c", hash_comment, input_file])
+
+        assert p_threads.returncode == 0
+        assert p_threads.stdout == p_single.stdout
+
+
+class TestMiniBatchSizer:
+    def test_fixed_lines(self):
+        sizer = cli.MiniBatchSizer(max_lines=3)
+        assert not sizer.is_full(2, 10000)
+        assert sizer.is_full(3, 3)
+        sizer.update(10000, 1.0)
+        assert sizer.is_full(3, 3)
+
+    def test_char_budget(self):
+        sizer = cli.MiniBatchSizer(max_lines=3, max_chars=100)
+        assert not sizer.is_full(10, 99)
+        assert sizer.is_full(1, 100)
+
+    def test_adapt_to_latency(self):
+        sizer = cli.MiniBatchSizer(max_chars=1000, target_latency=0.5)
+        sizer.update(1000, 0.1)
+        assert sizer.max_chars == 5000
+        for _ in range(20):
+            sizer.update(1000, 1.0)
+        assert 500 <= sizer.max_chars < 1000
+        min_chars, max_chars = cli.MINI_BATCH_CHARS_RANGE
+        for _ in range(100):
+            sizer.update(1, 100.0)
+        assert sizer.max_chars == min_chars
+
 
 class TestRun:
     def test_run_as_single_when_input_is_a_tty(self, mocker, output_file, long_input_file):
@@ -286,7 +380,7 @@ class TestRun:
 
     @pytest.mark.parametrize(
         "output_format",
-        ["conllu", "cabocha", "mecab", "json"],
+        ["conllu", "cabocha", "mecab", "json", "jsonl"],
     )
     def test_parallel_output_same_as_single(self, output_format, mocker, tmpdir, long_input_file):
         mocker.patch.object(cli, "MINI_BATCH_SIZE", 5)
@@ -325,3 +419,139 @@ class TestRun:
             with open(out_parallel, "r") as f_p:
                 for s, p in zip(f_s, f_p):
                     assert s == p
+
+    def test_analyzer_pool_reused_across_runs(self, mocker, tmpdir, input_file, long_input_file):
+        mocker.patch.object(cli, "MINI_BATCH_SIZE", 5)
+
+        analyzer = Analyzer("ja_ginza", None, "print", "conllu", -1, False, False)
+        with AnalyzerPool(analyzer, 2) as pool:
+            for path in [input_file, long_input_file]:
+                out_single = tmpdir / "single_output.txt"
+                cli.run(output_path=out_single, files=[path], ensure_model="ja_ginza")
+                out_pool = tmpdir / "pool_output.txt"
+                cli.run(output_path=out_pool, files=[path], analyzer_pool=pool)
+                assert pool.started
+                with open(out_single, "r") as f_s:
+                    with open(out_pool, "r") as f_p:
+                        assert f_s.read() == f_p.read()
+        assert not pool.started
+
+    @pytest.mark.parametrize(
+        "parallel_level, batch_chars, batch_latency",
+        [(1, 50, 0.0), (1, 50, 0.01), (2, 50, 0.01)],
+    )
+    def test_batch_chars_output_same_as_lines(self, parallel_level, batch_chars, batch_latency, tmpdir, long_input_file):
+        out_lines = tmpdir / "lines_output.txt"
+        cli.run(output_path=out_lines, files=[long_input_file], ensure_model="ja_ginza")
+        out_chars = tmpdir / "chars_output.txt"
+        cli.run(
+            parallel_level=parallel_level,
+            output_path=out_chars,
+            files=[long_input_file],
+            ensure_model="ja_ginza",
+            batch_chars=batch_chars,
+            batch_latency=batch_latency,
+        )
+        with open(out_lines, "r") as f_l:
+            with open(out_chars, "r") as f_c:
+                assert f_l.read() == f_c.read()
+
+    @pytest.mark.parametrize(
+        "output_format",
+        ["conllu", "mecab", "json"],
+    )
+    def test_shm_transport_output_same_as_queue(self, output_format, mocker, tmpdir, long_input_file):
+        mocker.patch.object(cli, "MINI_BATCH_SIZE", 5)
+
+        outputs = []
+        for result_transport in ["queue", "shm"]:
+            out_parallel = tmpdir / f"parallel_{result_transport}_output.txt"
+            cli.run(
+                parallel_level=2,
+                output_path=out_parallel,
+                output_format=output_format,
+                files=[long_input_file],
+                ensure_model="ja_ginza",
+                result_transport=result_transport,
+            )
+            with open(out_parallel, "r") as f:
+                outputs.append(f.read())
+        assert outputs[0] == outputs[1]
+
+    @pytest.mark.parametrize(
+        "parallel_level",
+        [1, 2],
+    )
+    def test_unordered_output_same_as_ordered(self, parallel_level, mocker, tmpdir, long_input_file):
+        mocker.patch.object(cli, "MINI_BATCH_SIZE", 5)
+
+        out_ordered = tmpdir / "ordered_output.txt"
+        cli.run(parallel_level=1, output_path=out_ordered, output_format="conllu", files=[long_input_file], ensure_model="ja_ginza")
+        out_unordered = tmpdir / f"unordered_{parallel_level}_output.txt"
+        cli.run(
+            parallel_level=parallel_level,
+            output_path=out_unordered,
+            output_format="conllu",
+            files=[long_input_file],
+            ensure_model="ja_ginza",
+            unordered=True,
+        )
+
+        with open(out_unordered, "r") as f:
+            chunks = {}
+            offset = None
+            for line in f:
+                if line.startswith("# input_offset = "):
+                    offset = int(line[len("# input_offset = "):])
+                    chunks[offset] = []
+                else:
+                    chunks[offset].append(line)
+        assert sorted(chunks) == list(range(0, len(chunks) * 5, 5))
+        with open(out_ordered, "r") as f:
+            assert "".join(line for offset in sorted(chunks) for line in chunks[offset]) == f.read()
+
+    def test_analyzer_pool_max_pending(self, long_input_file):
+        analyzer = Analyzer("ja_ginza", None, "print", "mecab", -1, False, False)
+        with pytest.raises(AssertionError):
+            AnalyzerPool(analyzer, 2, max_pending=2)
+        with open(long_input_file, "r") as f:
+            batches = [[line] for line in f]
+        with AnalyzerPool(analyzer, 2, max_pending=3) as pool:
+            ordered = list(pool.analyze_batches(batches))
+            unordered = dict(pool.analyze_batches_unordered(batches))
+        assert [unordered[i] for i in range(len(batches))] == ordered
+
+    @pytest.mark.parametrize(
+        "parallel_level, output_format",
+        [
+            (1, "conllu"),
+            (2, "cabocha"),
+            (2, "json"),
+        ],
+    )
+    def test_render_docbin_same_as_direct(self, parallel_level, output_format, mocker, tmpdir, long_input_file):
+        mocker.patch.object(cli, "MINI_BATCH_SIZE", 5)
+
+        shard_dir = tmpdir / f"shards_{parallel_level}"
+        cli.run(
+            parallel_level=parallel_level,
+            output_path=shard_dir,
+            output_format="docbin",
+            files=[long_input_file],
+            ensure_model="ja_ginza",
+        )
+        shards = sorted(os.listdir(shard_dir))
+        assert len(shards) > 1 and all(shard.endswith(".spacy") for shard in shards)
+
+        out_render = tmpdir / "render_output.txt"
+        cli.render(output_path=out_render, output_format=output_format, files=[shard_dir])
+        out_direct = tmpdir / "direct_output.txt"
+        cli.run(
+            hash_comment="analyze",
+            output_path=out_direct,
+            output_format=output_format,
+            files=[long_input_file],
+            ensure_model="ja_ginza",
+        )
+        with open(out_render, "r") as f_render, open(out_direct, "r") as f_direct:
+            assert f_render.read() == f_direct.read()
@@ -34,6 +34,26 @@ POS_TESTS_JA_GINZA_ELECTRA = [
     ("すもももももももものうち", ["NOUN", "ADP", "NOUN", "ADP", "NOUN", "ADP", "NOUN"]),
 ]
 
+BUNSETU_TESTS_JA_GINZA = [
+    (
+        "銀座でランチをご一緒しましょう。",
+        (0, 2, 5),
+        ["B", "I", "B", "I", "B", "I", "I", "I", "I"],
+        ["SEM_HEAD", "SYN_HEAD", "SEM_HEAD", "SYN_HEAD", "CONT", "ROOT", "SYN_HEAD", "SYN_HEAD", "CONT"],
+        {5: [0, 1, 2, 3, 4, 5, 6, 7, 8]},
+    ),
+    (
+        "雨が降ったので、私は家で本を読み、弟は外で遊んだ。",
+        (0, 2, 7, 9, 11, 13, 15, 17, 19),
+        ["B", "I", "B", "I", "I", "I", "I", "B", "I", "B", "I", "B", "I", "B", "I", "B", "I", "B", "I", "B", "I", "I"],
+        [
+            "SEM_HEAD", "SYN_HEAD", "SEM_HEAD", "SYN_HEAD", "SYN_HEAD", "SYN_HEAD", "CONT", "SEM_HEAD", "SYN_HEAD", "SEM_HEAD", "SYN_HEAD",
+            "SEM_HEAD", "SYN_HEAD", "SEM_HEAD", "CONT", "SEM_HEAD", "SYN_HEAD", "SEM_HEAD", "SYN_HEAD", "ROOT", "SYN_HEAD", "CONT",
+        ],
+        {2: [0, 1, 2, 3, 4, 5, 6], 13: [7, 8, 9, 10, 11, 12, 13, 14], 19: [15, 16, 17, 18, 19, 20, 21]},
+    ),
+]
+
 LEMMATIZE_TESTS = [
     ("新しく", "新しい"),
     ("いただきました", "いただく"),
@@ -180,6 +200,46 @@ def test_compound_spliter(nlp, text, len_a, len_b, len_c):
         assert len(nlp(text)) == l
 
 
+@pytest.mark.parametrize("nlp", ["ja_ginza"], indirect=True)
+def test_compound_spliter_heads(nlp):
+    splitter = nlp.get_pipe("compound_splitter")
+    split_tokens, skipped_tokens = splitter.split_tokens, splitter.skipped_tokens
+    set_split_mode(nlp, "A")
+    doc = nlp("選挙管理委員会の会議に参加した。")
+    set_split_mode(nlp, None)
+    assert splitter.split_tokens - split_tokens == 1
+    assert splitter.skipped_tokens - skipped_tokens == 7
+    assert [(token.orth_, token.dep_, token.head.i) for token in doc] == [
+        ("選挙", "compound", 3),
+        ("管理", "compound", 3),
+        ("委員", "compound", 3),
+        ("会", "nmod", 5),
+        ("の", "case", 3),
+        ("会議", "obl", 7),
+        ("に", "case", 5),
+        ("参加", "ROOT", 7),
+        ("し", "aux", 7),
+        ("た", "aux", 7),
+        ("。", "punct", 7),
+    ]
+    assert doc.tensor.shape[0] == len(doc)
+    assert not doc.tensor[:4].any()
+    assert doc.tensor[4:].any(axis=1).all()
+
+
+@pytest.mark.parametrize("nlp", ["ja_ginza"], indirect=True)
+def test_compound_spliter_cache(nlp):
+    splitter = nlp.get_pipe("compound_splitter")
+    set_split_mode(nlp, "A")
+    nlp("選挙管理委員会の会議に参加した。")
+    stats = splitter.stats()
+    nlp("選挙管理委員会の会議に参加した。")
+    set_split_mode(nlp, None)
+    delta = {k: v - stats[k] for k, v in splitter.stats().items()}
+    assert delta["resolve_pos_misses"] == 0 and delta["resolve_pos_hits"] > 0
+    assert delta["morph_misses"] == 0 and delta["morph_hits"] == 4
+
+
 @pytest.mark.parametrize("nlp", MODELS, indirect=True)
 @pytest.mark.parametrize("text, expected_tags", TAG_TESTS)
 def test_tag(nlp, text, expected_tags):
@@ -201,6 +261,63 @@ def test_pos_ja_ginza_electra(nlp, text, expected_poss):
     assert poss == expected_poss
 
 
+@pytest.mark.parametrize("nlp", ["ja_ginza"], indirect=True)
+@pytest.mark.parametrize("text, heads, bi_labels, position_types, clauses", BUNSETU_TESTS_JA_GINZA)
+def test_bunsetu_recognizer_ja_ginza(nlp, text, heads, bi_labels, position_types, clauses):
+    doc = nlp(text)
+    assert doc.user_data["bunsetu_heads"] == heads
+    assert doc.user_data["bunsetu_bi_labels"] == bi_labels
+    assert doc.user_data["bunsetu_position_types"] == position_types
+    assert doc.user_data["clauses"] == clauses
+    assert doc.user_data["clause_heads"] == [head for head, tokens in clauses.items() for _ in tokens]
+    assert not any(token.dep_.endswith("_bunsetu") for token in doc)
+
+
+@pytest.mark.parametrize("nlp", ["ja_ginza"], indirect=True)
+@pytest.mark.parametrize("text, heads, bi_labels, position_types, clauses", BUNSETU_TESTS_JA_GINZA)
+def test_bunsetu_span_index_ja_ginza(nlp, text, heads, bi_labels, position_types, clauses):
+    from ginza import bunsetu_phrase_span, bunsetu_span
+
+    doc = nlp(text)
+    scanned = doc.copy()
+    del scanned.user_data["bunsetu_span_ids"]
+    del scanned.user_data["bunsetu_span_index"]
+    for token, scanned_token in zip(doc, scanned):
+        for func in [bunsetu_span, bunsetu_phrase_span]:
+            span = func(token)
+            scanned_span = func(scanned_token)
+            assert (span.start, span.end, span.label_) == (scanned_span.start, scanned_span.end, scanned_span.label_)
+
+
+@pytest.mark.parametrize("nlp", ["ja_ginza"], indirect=True)
+@pytest.mark.parametrize("text, heads, bi_labels, position_types, clauses", BUNSETU_TESTS_JA_GINZA)
+def test_bunsetu_head_index_ja_ginza(nlp, text, heads, bi_labels, position_types, clauses):
+    from ginza import bunsetu_head_list, bunsetu_head_tokens, is_bunsetu_head
+
+    doc = nlp(text)
+    assert [is_bunsetu_head(token) for token in doc] == [token.i in heads for token in doc]
+    del doc.user_data["bunsetu_head_flags"]
+    assert [is_bunsetu_head(token) for token in doc] == [token.i in heads for token in doc]
+    for start in range(len(doc)):
+        for end in range(start, len(doc) + 1):
+            expected = [i for i in heads if start <= i < end]
+            assert bunsetu_head_list(doc[start:end]) == [i - start for i in expected]
+            assert [token.i for token in bunsetu_head_tokens(doc[start:end])] == expected
+
+
+@pytest.mark.parametrize("nlp", ["ja_ginza"], indirect=True)
+@pytest.mark.parametrize("text, heads, bi_labels, position_types, clauses", BUNSETU_TESTS_JA_GINZA)
+def test_clause_head_ja_ginza(nlp, text, heads, bi_labels, position_types, clauses):
+    from ginza import clause_head_i, clause_head_list
+
+    doc = nlp(text)
+    clause_heads = [head for head, tokens in clauses.items() for _ in tokens]
+    assert clause_head_list(doc) == clause_heads
+    for sent in doc.sents:
+        assert [clause_head_i(token, sent.start) for token in sent] == [clause_head_i(token) for token in sent]
+        assert clause_head_list(sent) == [head - sent.start for head in clause_heads[sent.start:sent.end]]
+
+
 @pytest.mark.parametrize("nlp", MODELS, indirect=True)
 @pytest.mark.parametrize("text, lemma", LEMMATIZE_TESTS)
 def test_lemmatize(nlp, text, lemma):